@@ -0,0 +1,57 @@
+from utils.io import load_dataset_counts, save_split_cache, source_signature, split_cache_path
+
+import argparse
+import ast
+import json
+import os
+import pandas as pd
+
+
+def main(args):
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
+    num_keyphrases = len(pd.read_csv(args.data_dir + args.keyphrase_set))
+
+    for name in args.splits:
+        if not os.path.isfile(args.data_dir + name):
+            continue
+        df = pd.read_csv(args.data_dir + name)
+        df[args.keyphrase_vector_col] = df[args.keyphrase_vector_col].apply(ast.literal_eval)
+        save_split_cache(df, split_cache_path(args.data_dir, name), args.user_col, args.item_col, args.rating_col,
+                         args.keyphrase_vector_col, source=args.data_dir + name)
+        print("Cached {} ({} rows)".format(name, len(df)))
+
+    with open(args.data_dir + 'cache/meta.json', 'w') as meta_file:
+        json.dump({'num_users': int(num_users), 'num_items': int(num_items), 'num_keyphrases': num_keyphrases,
+                   'sources': [source_signature(args.data_dir + args.user_col + '.csv'),
+                               source_signature(args.data_dir + args.item_col + '.csv')]},
+                  meta_file)
+
+
+if __name__ == "__main__":
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description="Dataset Binary Cache")
+
+    parser.add_argument('--data_dir', dest='data_dir', default="data/beer/",
+                        help='Directory path to the dataset. (default: %(default)s)')
+
+    parser.add_argument('--item_col', dest='item_col', default="ItemIndex",
+                        help='Item column name in the dataset. (default: %(default)s)')
+
+    parser.add_argument('--keyphrase', dest='keyphrase_set', default="KeyPhrases.csv",
+                        help='Keyphrase file name in the dataset. (default: %(default)s)')
+
+    parser.add_argument('--keyphrase_vector_col', dest='keyphrase_vector_col', default="keyVector",
+                        help='Keyphrase vector column name in the dataset. (default: %(default)s)')
+
+    parser.add_argument('--rating_col', dest='rating_col', default="Binary",
+                        help='Rating column name in the dataset. (default: %(default)s)')
+
+    parser.add_argument('--splits', dest='splits', nargs='+', default=['Train.csv', 'Valid.csv', 'Test.csv'],
+                        help='Split files to cache. (default: %(default)s)')
+
+    parser.add_argument('--user_col', dest='user_col', default="UserIndex",
+                        help='User column name in the dataset. (default: %(default)s)')
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,9 +1,11 @@
 from utils.reformat import to_sparse_matrix
-from utils.split import leave_one_out_split
+from utils.split import holdout_split
 
 import argparse
+import os
 import pandas as pd
 import scipy.sparse as sparse
+import shutil
 
 
 def main(args):
@@ -12,22 +14,21 @@ def main(args):
     num_users = df[args.user_col].nunique()
     num_items = df[args.item_col].nunique()
 
-    df_train, df_test = leave_one_out_split(df, args.user_col, 0.2, random_state=args.seed)
+    df_train, df_valid, df_test = holdout_split(df, args.user_col, 0.2, random_state=args.seed,
+                                                validation=args.enable_validation)
 
+    splits = [('Train', df_train), ('Test', df_test)]
     if args.enable_validation:
-        df_train, df_valid = leave_one_out_split(df_train, args.user_col, 0.2, random_state=args.seed)
+        splits.append(('Valid', df_valid))
 
-        df_valid.to_csv(args.data_dir + 'Valid.csv')
-        R_valid = to_sparse_matrix(df_valid, num_users, num_items, args.user_col, args.item_col, args.rating_col)
-        sparse.save_npz(args.data_dir+'Rvalid.npz', R_valid)
+    # Binary caches and shared stores of the previous splits are stale
+    if os.path.isdir(args.data_dir + 'cache/'):
+        shutil.rmtree(args.data_dir + 'cache/')
 
-    df_train.to_csv(args.data_dir + 'Train.csv')
-    R_train = to_sparse_matrix(df_train, num_users, num_items, args.user_col, args.item_col, args.rating_col)
-    sparse.save_npz(args.data_dir + 'Rtrain.npz', R_train)
-
-    df_test.to_csv(args.data_dir + 'Test.csv')
-    R_test = to_sparse_matrix(df_test, num_users, num_items, args.user_col, args.item_col, args.rating_col)
-    sparse.save_npz(args.data_dir + 'Rtest.npz', R_test)
+    for name, df_split in splits:
+        df_split.to_csv(args.data_dir + name + '.csv')
+        R = to_sparse_matrix(df_split, num_users, num_items, args.user_col, args.item_col, args.rating_col)
+        sparse.save_npz(args.data_dir + 'R' + name.lower() + '.npz', R)
 
 
 if __name__ == "__main__":
@@ -47,7 +48,7 @@ if __name__ == "__main__":
     parser.add_argument('--rating_col', dest='rating_col', default="Binary",
                         help='Rating column name in the dataset. (default: %(default)s)')
 
-    parser.add_argument('--seed', dest='seed', default=8292,
+    parser.add_argument('--seed', dest='seed', type=int, default=8292,
                         help='Seed used to split dataset. (default: %(default)s)')
 
     parser.add_argument('--user_col', dest='user_col', default="UserIndex",
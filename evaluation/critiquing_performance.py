@@ -1,6 +1,6 @@
-from evaluation.general_performance import average_precisionk
+from evaluation.general_performance import average_precisionk_matrix
 from tqdm import tqdm
-from utils.critique import critique_keyphrase, latent_density
+from utils.critique import critique_keyphrases, latent_density
 
 import numpy as np
 import pandas as pd
@@ -8,21 +8,21 @@ import pandas as pd
 
 def critiquing_evaluation(model, model_name, num_users, num_items, num_users_sampled, topk):
     fmap_results = [[] for _ in topk]
-    for iteration in range(5):
-        sampled_users = np.random.choice(num_users, num_users_sampled)
-        for user in tqdm(sampled_users):
-            top_items_before_critique, top_items_after_critique, affected_items = critique_keyphrase(model, user,
-                                                                                                     num_items,
-                                                                                                     topk_keyphrase=10)
+    # Sample the users of all iterations up front so users drawn more than once share their keyphrase index
+    sampled_users = np.concatenate([np.random.choice(num_users, num_users_sampled) for iteration in range(5)])
+    top_items_before_critique, top_items_after_critique, affected_items = critique_keyphrases(model,
+                                                                                              sampled_users,
+                                                                                              num_items,
+                                                                                              topk_keyphrase=10,
+                                                                                              num_ranked=max(topk))
 
-            all_items = np.array(range(num_items))
-            unaffected_items = all_items[~np.in1d(all_items, affected_items)]
-
-            for i, k in enumerate(topk):
-                fmap_results[i].append(average_precisionk(top_items_before_critique[:k],
-                                                          np.isin(top_items_before_critique[:k], affected_items))
-                                       - average_precisionk(top_items_after_critique[:k],
-                                                            np.isin(top_items_after_critique[:k], affected_items)))
+    for i, k in enumerate(topk):
+        fmap_results[i].extend(average_precisionk_matrix(hits=np.take_along_axis(affected_items,
+                                                                                 top_items_before_critique[:, :k],
+                                                                                 axis=1))
+                               - average_precisionk_matrix(hits=np.take_along_axis(affected_items,
+                                                                                   top_items_after_critique[:, :k],
+                                                                                   axis=1)))
 
     fmap_results_dict = dict()
     fmap_results_dict['model'] = model_name
@@ -1,7 +1,9 @@
-from tqdm import tqdm
+from utils.reformat import to_keyphrase_matrix
 
+import ast
 import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
 
 
 def recallk(vector_true_dense, hits, **unused):
@@ -46,6 +48,35 @@ def click(hits, **unused):
         return first_hit/10
 
 
+def recallk_matrix(num_true, hits, **unused):
+    return hits.sum(axis=1)/num_true.astype(np.float64)
+
+
+def precisionk_matrix(hits, **unused):
+    return hits.sum(axis=1)/float(hits.shape[1])
+
+
+def average_precisionk_matrix(hits, **unused):
+    precisions = np.cumsum(hits, axis=1, dtype=np.float32)/np.arange(1, hits.shape[1]+1)
+    return np.mean(precisions, axis=1)
+
+
+def r_precision_matrix(num_true, hits, **unused):
+    cumulative_hits = np.cumsum(hits, axis=1)
+    cutoff = np.minimum(num_true, hits.shape[1]) - 1
+    return cumulative_hits[np.arange(len(num_true)), cutoff]/num_true.astype(np.float64)
+
+
+def ndcg_matrix(num_true, hits, **unused):
+    idcg = np.cumsum(_dcg_support(max(num_true.max(initial=0), 1)))[num_true-1]
+    dcg = np.sum(hits*_dcg_support(hits.shape[1]), axis=1)
+    return dcg/idcg
+
+
+def click_matrix(hits, **unused):
+    return np.where(hits.any(axis=1), np.argmax(hits, axis=1)/10, 5)
+
+
 def evaluate(matrix_Predict, matrix_Test, metric_names, atK, analytical=False):
     """
     :param matrix_Predict: Rating matrix for evaluation, prediction.
@@ -55,119 +86,119 @@ def evaluate(matrix_Predict, matrix_Test, metric_names, atK, analytical=False):
     :return:
     """
     global_metrics = {
-        "R-Precision": r_precision,
-        "NDCG": ndcg,
-        "Clicks": click
+        "R-Precision": r_precision_matrix,
+        "NDCG": ndcg_matrix,
+        "Clicks": click_matrix
     }
 
     local_metrics = {
-        "Precision": precisionk,
-        "Recall": recallk,
-        "MAP": average_precisionk
+        "Precision": precisionk_matrix,
+        "Recall": recallk_matrix,
+        "MAP": average_precisionk_matrix
     }
 
     output = dict()
 
     num_users = matrix_Predict.shape[0]
 
+    # Users x predictions hit matrix, built once with a vectorized CSR membership lookup
+    matrix_True = sparse.csr_matrix(matrix_Test != 0)
+    num_true = matrix_True.getnnz(axis=1)
+    hits = np.asarray(matrix_True[np.repeat(np.arange(num_users), matrix_Predict.shape[1]),
+                                  matrix_Predict.ravel()]).reshape(matrix_Predict.shape).astype(bool)
+
     for k in atK:
 
         local_metric_names = list(set(metric_names).intersection(local_metrics.keys()))
-        results = {name: [] for name in local_metric_names}
-        topK_Predict = matrix_Predict[:, :k]
-
-        for user_index in tqdm(range(topK_Predict.shape[0])):
-            vector_predict = topK_Predict[user_index]
-            if len(vector_predict.nonzero()[0]) > 0:
-                vector_true = matrix_Test[user_index]
-                vector_true_dense = vector_true.nonzero()[1]
-                hits = np.isin(vector_predict, vector_true_dense)
-
-                if vector_true_dense.size > 0:
-                    for name in local_metric_names:
-                        results[name].append(local_metrics[name](vector_true_dense=vector_true_dense,
-                                                                 vector_predict=vector_predict,
-                                                                 hits=hits))
+        evaluated = (matrix_Predict[:, :k] != 0).any(axis=1) & (num_true > 0)
 
         results_summary = dict()
-        if analytical:
-            for name in local_metric_names:
-                results_summary['{0}@{1}'.format(name, k)] = results[name]
-        else:
-            for name in local_metric_names:
-                results_summary['{0}@{1}'.format(name, k)] = (np.average(results[name]),
-                                                              1.96*np.std(results[name])/np.sqrt(num_users))
+        for name in local_metric_names:
+            results = local_metrics[name](num_true=num_true[evaluated], hits=hits[evaluated, :k])
+            if analytical:
+                results_summary['{0}@{1}'.format(name, k)] = results.tolist()
+            else:
+                results_summary['{0}@{1}'.format(name, k)] = (np.average(results),
+                                                              1.96*np.std(results)/np.sqrt(num_users))
         output.update(results_summary)
 
     global_metric_names = list(set(metric_names).intersection(global_metrics.keys()))
-    results = {name: [] for name in global_metric_names}
-
-    topK_Predict = matrix_Predict[:]
-
-    for user_index in tqdm(range(topK_Predict.shape[0])):
-        vector_predict = topK_Predict[user_index]
-
-        if len(vector_predict.nonzero()[0]) > 0:
-            vector_true = matrix_Test[user_index]
-            vector_true_dense = vector_true.nonzero()[1]
-            hits = np.isin(vector_predict, vector_true_dense)
-
-            # if user_index == 1:
-            #     import ipdb;
-            #     ipdb.set_trace()
-
-            if vector_true_dense.size > 0:
-                for name in global_metric_names:
-                    results[name].append(global_metrics[name](vector_true_dense=vector_true_dense,
-                                                              vector_predict=vector_predict,
-                                                              hits=hits))
+    evaluated = (matrix_Predict != 0).any(axis=1) & (num_true > 0)
 
     results_summary = dict()
-    if analytical:
-        for name in global_metric_names:
-            results_summary[name] = results[name]
-    else:
-        for name in global_metric_names:
-            results_summary[name] = (np.average(results[name]), 1.96*np.std(results[name])/np.sqrt(num_users))
+    for name in global_metric_names:
+        results = global_metrics[name](num_true=num_true[evaluated], hits=hits[evaluated])
+        if analytical:
+            results_summary[name] = results.tolist()
+        else:
+            results_summary[name] = (np.average(results), 1.96*np.std(results)/np.sqrt(num_users))
     output.update(results_summary)
 
     return output
 
 
+def prepare_explanation_ground_truth(df_test, user_col, item_col, rating_col, keyphrase_vector_col):
+    """
+    Parse the test keyphrase lists once so repeated explanation evaluations can skip it.
+    :param df_test: Test reviews, keyphrase vectors either as lists or as their string form.
+    :return: Positive reviews with at least one keyphrase, keyphrase vectors as lists.
+    """
+    df_test = df_test[df_test[rating_col] == 1]  # Remove negatives reviews
+    keyphrase_vectors = df_test[keyphrase_vector_col]
+    if len(keyphrase_vectors) and isinstance(keyphrase_vectors.iloc[0], str):
+        keyphrase_vectors = keyphrase_vectors.apply(ast.literal_eval)
+
+    df_test = df_test[[user_col, item_col]].copy()
+    df_test[keyphrase_vector_col] = keyphrase_vectors
+    return df_test[keyphrase_vectors.map(len) > 0]  # Remove reviews without keyphrases matched
+
+
 def evaluate_explanation(df_predict, df_test, metric_names, atK, user_col,
-                         item_col, rating_col, keyphrase_vector_col):
-    df_test = df_test[(df_test[rating_col] == 1) & (df_test[keyphrase_vector_col] != '[]')] # Remove negatives reviews and reviews without keyphrases matched
-    df_test = df_test[[user_col, item_col, keyphrase_vector_col]]
-    df_test[keyphrase_vector_col] = df_test[keyphrase_vector_col].apply(lambda x: eval(x))
+                         item_col, rating_col, keyphrase_vector_col, ground_truth=None):
+    """
+    :param ground_truth: Output of prepare_explanation_ground_truth for df_test, parsed from df_test if not given.
+    """
+    if ground_truth is None:
+        ground_truth = prepare_explanation_ground_truth(df_test, user_col, item_col, rating_col, keyphrase_vector_col)
     df_predict = df_predict[[user_col, item_col, 'ExplanIndex']]
-    res = pd.merge(df_test, df_predict, how='inner', on=[user_col, item_col])
+    res = pd.merge(ground_truth, df_predict, how='inner', on=[user_col, item_col])
 
     global_metrics = {
         # "R-Precision": r_precision,
-        "NDCG": ndcg,
-        "Precision": precisionk,
-        "Recall": recallk,
-        "MAP": average_precisionk
+        "NDCG": ndcg_matrix,
+        "Precision": precisionk_matrix,
+        "Recall": recallk_matrix,
+        "MAP": average_precisionk_matrix
     }
 
     output = dict()
 
     num_interactionss = len(res)
 
-    for k in atK:
-        res['hits'] = res.apply(lambda x: list(np.isin(x['ExplanIndex'][:k], x[keyphrase_vector_col])), axis=1)
+    global_metric_names = list(set(metric_names).intersection(global_metrics.keys()))
+
+    if num_interactionss == 0:
+        # No rated test interaction has a prediction, every metric is undefined
+        for k in atK:
+            output.update({'{0}@{1}'.format(name, k): (np.nan, np.nan) for name in global_metric_names})
+        return output
 
-        global_metric_names = list(set(metric_names).intersection(global_metrics.keys()))
+    keyphrase_vectors = res[keyphrase_vector_col].tolist()
+    explanations = np.array(res['ExplanIndex'].tolist(), dtype=np.int64).reshape(num_interactionss, -1)
+    num_keyphrases = max(explanations.max(initial=-1),
+                         max((max(vector) for vector in keyphrase_vectors), default=-1)) + 1
 
-        for metric in tqdm(global_metric_names):
-            res[metric] = res.apply(lambda x: global_metrics[metric](vector_true_dense=x[keyphrase_vector_col],
-                                                                     vector_predict=x['ExplanIndex'][:k],
-                                                                     hits=x['hits']),
-                                    axis=1)
+    num_true = np.array([len(vector) for vector in keyphrase_vectors], dtype=np.int64)
+    matrix_True = to_keyphrase_matrix(keyphrase_vectors, num_keyphrases)
+    hits = np.asarray(matrix_True[np.repeat(np.arange(num_interactionss), explanations.shape[1]),
+                                  explanations.ravel()]).reshape(explanations.shape) != 0
+
+    for k in atK:
         results_summary = dict()
         for name in global_metric_names:
-            results_summary['{0}@{1}'.format(name, k)] = (np.average(res[name]),
-                                                          1.96 * np.std(res[name]) / np.sqrt(num_interactionss))
+            results = global_metrics[name](num_true=num_true, hits=hits[:, :k])
+            results_summary['{0}@{1}'.format(name, k)] = (np.average(results),
+                                                          1.96 * np.std(results) / np.sqrt(num_interactionss))
         output.update(results_summary)
 
     return output
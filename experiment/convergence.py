@@ -1,10 +1,11 @@
-from evaluation.general_performance import evaluate, evaluate_explanation
+from evaluation.general_performance import evaluate, evaluate_explanation, prepare_explanation_ground_truth
+from models.optimizers import optimizers
 from prediction.predictor import predict_elementwise, predict_explanation
 from utils.io import save_dataframe_csv
 from utils.modelnames import models, explanable_models
 from utils.progress import WorkSplitter
 from utils.reformat import to_sparse_matrix
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import json
 import pandas as pd
@@ -44,6 +45,7 @@ def converge(num_users, num_items, user_col, item_col, rating_col, keyphrase_vec
                                                 batch_size=row['train_batch_size'],
                                                 num_keyphrases=len(keyphrase_names),
                                                 negative_sampling_size=row['negative_sampling_size'])
+            negative_sampler = Prefetch_Sampler(negative_sampler)
 
             model = models[row['model']](num_users=num_users,
                                          num_items=num_items,
@@ -52,7 +54,8 @@ def converge(num_users, num_items, user_col, item_col, rating_col, keyphrase_vec
                                          num_layers=row['num_layers'],
                                          negative_sampler=negative_sampler,
                                          lamb=row['lambda'],
-                                         learning_rate=row['learning_rate'])
+                                         learning_rate=row['learning_rate'],
+                                         optimizer=optimizers[row['optimizer']])
 
             batches = negative_sampler.get_batches()
 
@@ -112,7 +115,8 @@ def converge(num_users, num_items, user_col, item_col, rating_col, keyphrase_vec
                 results = results.append(result_dict, ignore_index=True)
                 print("result is \n {}".format(results))
 
-            model.sess.close()
+            model.close()
+            negative_sampler.close()
             tf.reset_default_graph()
 
             save_dataframe_csv(results, table_path, file_name)
@@ -126,6 +130,8 @@ def explanation_converge(num_users, num_items, user_col, item_col, rating_col, k
     results = pd.DataFrame(columns=['model', 'rank', 'num_layers', 'train_batch_size', 'predict_batch_size',
                                     'lambda', 'topK', 'learning_rate', 'epoch', 'negative_sampling_size', 'optimizer'])
 
+    ground_truth = prepare_explanation_ground_truth(df_test, user_col, item_col, rating_col, keyphrase_vector_col)
+
     for run in range(3):
 
         for idx, row in df.iterrows():
@@ -152,6 +158,7 @@ def explanation_converge(num_users, num_items, user_col, item_col, rating_col, k
                                                 batch_size=row['train_batch_size'],
                                                 num_keyphrases=len(keyphrase_names),
                                                 negative_sampling_size=1)
+            negative_sampler = Prefetch_Sampler(negative_sampler)
             # explanation does not sensitive to negative samples
 
             model = models[row['model']](num_users=num_users,
@@ -161,7 +168,8 @@ def explanation_converge(num_users, num_items, user_col, item_col, rating_col, k
                                          num_layers=row['num_layers'],
                                          negative_sampler=negative_sampler,
                                          lamb=row['lambda'],
-                                         learning_rate=row['learning_rate'])
+                                         learning_rate=row['learning_rate'],
+                                         optimizer=optimizers[row['optimizer']])
 
             batches = negative_sampler.get_batches()
 
@@ -199,7 +207,8 @@ def explanation_converge(num_users, num_items, user_col, item_col, rating_col, k
                                               user_col,
                                               item_col,
                                               rating_col,
-                                              keyphrase_vector_col)
+                                              keyphrase_vector_col,
+                                              ground_truth=ground_truth)
 
                 # Note Finished yet
                 result_dict = {'model': row['model'],
@@ -219,7 +228,8 @@ def explanation_converge(num_users, num_items, user_col, item_col, rating_col, k
                 results = results.append(result_dict, ignore_index=True)
                 print("result is \n {}".format(results))
 
-            model.sess.close()
+            model.close()
+            negative_sampler.close()
             tf.reset_default_graph()
 
             save_dataframe_csv(results, table_path, file_name)
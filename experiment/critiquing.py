@@ -2,7 +2,7 @@ from evaluation.critiquing_performance import critiquing_evaluation
 from utils.io import save_dataframe_csv, load_yaml
 from utils.modelnames import critiquing_models
 from utils.progress import WorkSplitter
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import pandas as pd
 import tensorflow.compat.v1 as tf
@@ -50,6 +50,7 @@ def critiquing(num_users, num_items, user_col, item_col, rating_col, keyphrase_v
                                             batch_size=train_batch_size,
                                             num_keyphrases=len(keyphrase_names),
                                             negative_sampling_size=negative_sampling_size)
+        negative_sampler = Prefetch_Sampler(negative_sampler)
 
         model = critiquing_models[algorithm](num_users=num_users,
                                              num_items=num_items,
@@ -71,11 +72,15 @@ def critiquing(num_users, num_items, user_col, item_col, rating_col, keyphrase_v
                               epoch=epoch)
             model.save_model(pretrained_path+params['model_saved_path'], row['model'])
 
+        if params['export']:
+            model.export_model(pretrained_path+params['model_saved_path'], row['model'])
+
         df_fmap = critiquing_evaluation(model, algorithm, num_users, num_items, num_users_sampled, topk=[5, 10, 20])
 
         dfs_fmap.append(df_fmap)
 
-        model.sess.close()
+        model.close()
+        negative_sampler.close()
         tf.reset_default_graph()
 
     df_output_fmap = pd.concat(dfs_fmap)
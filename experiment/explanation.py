@@ -1,9 +1,9 @@
 from evaluation.general_performance import evaluate_explanation
 from prediction.predictor import predict_explanation
 from utils.io import load_dataframe_csv, save_dataframe_csv, load_yaml
-from utils.modelnames import explanable_models
+from utils.modelnames import explanable_models, models
 from utils.progress import WorkSplitter
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import pandas as pd
 import tensorflow.compat.v1 as tf
@@ -52,6 +52,9 @@ def explain(num_users, num_items, user_col, item_col, rating_col, keyphrase_vect
                                             batch_size=train_batch_size,
                                             num_keyphrases=len(keyphrase_names),
                                             negative_sampling_size=negative_sampling_size)
+        # Popularity baselines never draw negative samples
+        if algorithm in models:
+            negative_sampler = Prefetch_Sampler(negative_sampler)
 
         model = explanable_models[algorithm](num_users=num_users,
                                              num_items=num_items,
@@ -64,11 +67,15 @@ def explain(num_users, num_items, user_col, item_col, rating_col, keyphrase_vect
 
         progress.subsection("Training")
 
-        model.train_model(df_train,
-                          user_col,
-                          item_col,
-                          rating_col,
-                          epoch=epoch)
+        try:
+            model.train_model(df_train,
+                              user_col,
+                              item_col,
+                              rating_col,
+                              epoch=epoch)
+        finally:
+            if isinstance(negative_sampler, Prefetch_Sampler):
+                negative_sampler.close()
 
         progress.subsection("Prediction")
 
@@ -104,10 +111,7 @@ def explain(num_users, num_items, user_col, item_col, rating_col, keyphrase_vect
 
         output_df = output_df.append(result_dict, ignore_index=True)
 
-        try:
-            model.sess.close()
-            tf.reset_default_graph()
-        except:
-            pass
+        model.close()
+        tf.reset_default_graph()
 
         save_dataframe_csv(output_df, table_path, save_path)
@@ -4,7 +4,7 @@ from utils.io import load_dataframe_csv, save_dataframe_csv, load_yaml, find_bes
 from utils.modelnames import models
 from utils.progress import WorkSplitter
 from utils.reformat import to_sparse_matrix
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import pandas as pd
 import tensorflow.compat.v1 as tf
@@ -56,6 +56,7 @@ def general(num_users, num_items, user_col, item_col, rating_col, keyphrase_vect
                                             batch_size=train_batch_size,
                                             num_keyphrases=len(keyphrase_names),
                                             negative_sampling_size=negative_sampling_size)
+        negative_sampler = Prefetch_Sampler(negative_sampler)
 
         model = models[algorithm](num_users=num_users,
                                   num_items=num_items,
@@ -116,7 +117,8 @@ def general(num_users, num_items, user_col, item_col, rating_col, keyphrase_vect
             result_dict[name] = round(result[name][0], 4)
         output_df = output_df.append(result_dict, ignore_index=True)
 
-        model.sess.close()
+        model.close()
+        negative_sampler.close()
         tf.reset_default_graph()
 
         save_dataframe_csv(output_df, table_path, save_path)
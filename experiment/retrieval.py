@@ -0,0 +1,158 @@
+from evaluation.general_performance import evaluate
+from prediction.predictor import predict_elementwise
+from prediction.retrieval import embedding_factors, predict_two_stage, svd_factors
+from utils.io import load_dataframe_csv, save_dataframe_csv, load_yaml, find_best_hyperparameters
+from utils.modelnames import models
+from utils.progress import WorkSplitter
+from utils.reformat import to_sparse_matrix
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
+
+import numpy as np
+import pandas as pd
+import tensorflow.compat.v1 as tf
+import time
+tf.disable_eager_execution()
+
+
+def retrieval(num_users, num_items, user_col, item_col, rating_col, keyphrase_vector_col, df_train, df_test, keyphrase_names, params, save_path):
+    progress = WorkSplitter()
+    table_path = load_yaml('config/global.yml', key='path')['tables']
+    df = find_best_hyperparameters(table_path + params['tuning_result_path'], 'NDCG')
+
+    try:
+        output_df = load_dataframe_csv(table_path, save_path)
+    except:
+        output_df = pd.DataFrame(columns=['model', 'rank', 'num_layers', 'lambda', 'learning_rate', 'epoch',
+                                          'retrieval', 'num_candidates', 'seconds', 'speedup'])
+
+    R_test = to_sparse_matrix(df_test,
+                              num_users,
+                              num_items,
+                              user_col,
+                              item_col,
+                              rating_col)
+
+    for index, row in df.iterrows():
+
+        algorithm = row['model']
+        rank = row['rank']
+        num_layers = row['num_layers']
+        train_batch_size = row['train_batch_size']
+        predict_batch_size = row['predict_batch_size']
+        lamb = row['lambda']
+        learning_rate = row['learning_rate']
+        epoch = 300
+        negative_sampling_size = row['negative_sampling_size']
+
+        row['topK'] = [5, 10, 15, 20, 50]
+        row['metric'] = ['R-Precision', 'NDCG', 'Clicks', 'Recall', 'Precision', 'MAP']
+
+        format = "model: {0}, rank: {1}, num_layers: {2}, train_batch_size: {3}, " \
+                 "predict_batch_size: {4}, lambda: {5}, learning_rate: {6}, epoch: {7}, negative_sampling_size: {8}"
+        progress.section(
+            format.format(algorithm, rank, num_layers, train_batch_size, predict_batch_size, lamb, learning_rate, epoch,
+                          negative_sampling_size))
+
+        progress.subsection("Initializing Negative Sampler")
+
+        negative_sampler = Negative_Sampler(df_train[[user_col,
+                                                      item_col,
+                                                      keyphrase_vector_col]],
+                                            user_col,
+                                            item_col,
+                                            rating_col,
+                                            keyphrase_vector_col,
+                                            num_items=num_items,
+                                            batch_size=train_batch_size,
+                                            num_keyphrases=len(keyphrase_names),
+                                            negative_sampling_size=negative_sampling_size)
+        negative_sampler = Prefetch_Sampler(negative_sampler)
+
+        model = models[algorithm](num_users=num_users,
+                                  num_items=num_items,
+                                  text_dim=len(keyphrase_names),
+                                  embed_dim=rank,
+                                  num_layers=num_layers,
+                                  negative_sampler=negative_sampler,
+                                  lamb=lamb,
+                                  learning_rate=learning_rate)
+
+        progress.subsection("Training")
+
+        model.train_model(df_train,
+                          user_col,
+                          item_col,
+                          rating_col,
+                          epoch=epoch)
+
+        # The two-stage pipeline re-ranks through model.predict, so the exhaustive baseline every speedup is
+        # measured against scores through predict as well. Whole-catalog scoring is reported alongside.
+        # Warm up both paths so caching the catalog projections is not timed
+        model.predict(np.zeros((1, 2), dtype=np.int32), explanation=False)
+        if hasattr(model, 'predict_all_items'):
+            model.predict_all_items(np.zeros(1, dtype=np.int32), explanation=False)
+
+        runs = []
+        for name, all_items in [('Exhaustive', False), ('Exhaustive Catalog', True)]:
+            progress.subsection("{0} Prediction".format(name))
+
+            start_time = time.time()
+            prediction, _ = predict_elementwise(model,
+                                                df_train,
+                                                user_col,
+                                                item_col,
+                                                row['topK'][-1],
+                                                batch_size=row['predict_batch_size'],
+                                                all_items=all_items)
+            runs.append((name, num_items, time.time() - start_time, prediction))
+        _, _, exhaustive_seconds, exhaustive_prediction = runs[0]
+
+        factors = {'SVD': svd_factors(df_train, num_users, num_items, user_col, item_col, rating_col, rank),
+                   'Embedding': embedding_factors(model)}
+
+        for name, (user_factors, item_factors) in factors.items():
+            for num_candidates in params['num_candidates']:
+                progress.subsection("Two-Stage Prediction: {0} top {1}".format(name, num_candidates))
+
+                start_time = time.time()
+                prediction = predict_two_stage(model,
+                                               df_train,
+                                               user_col,
+                                               item_col,
+                                               row['topK'][-1],
+                                               user_factors,
+                                               item_factors,
+                                               num_candidates=num_candidates,
+                                               batch_size=row['predict_batch_size'])
+                runs.append((name, num_candidates, time.time() - start_time, prediction))
+
+        for name, num_candidates, seconds, prediction in runs:
+            result = evaluate(prediction, R_test, row['metric'], row['topK'])
+
+            result_dict = {'model': algorithm,
+                           'rank': rank,
+                           'num_layers': num_layers,
+                           'lambda': lamb,
+                           'learning_rate': learning_rate,
+                           'epoch': epoch,
+                           'retrieval': name,
+                           'num_candidates': num_candidates,
+                           'seconds': round(seconds, 4),
+                           'speedup': round(exhaustive_seconds / seconds, 2)}
+
+            # Fraction of the exhaustive top k the two-stage pipeline recovers
+            for k in row['topK']:
+                overlap = [len(np.intersect1d(a, b)) for a, b in zip(prediction[:, :k], exhaustive_prediction[:, :k])]
+                result_dict['Overlap@{0}'.format(k)] = round(np.mean(overlap) / k, 4)
+
+            for metric in result.keys():
+                result_dict[metric] = round(result[metric][0], 4)
+            output_df = output_df.append(result_dict, ignore_index=True)
+
+        model.close()
+        negative_sampler.close()
+        tf.reset_default_graph()
+
+        save_dataframe_csv(output_df, table_path, save_path)
+
+    return output_df
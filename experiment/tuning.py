@@ -1,16 +1,15 @@
-from evaluation.general_performance import evaluate, evaluate_explanation
+from evaluation.general_performance import evaluate, evaluate_explanation, prepare_explanation_ground_truth
 from prediction.predictor import predict_elementwise, predict_explanation
 from utils.io import load_dataframe_csv, save_dataframe_csv, load_yaml
 from utils.progress import WorkSplitter
 from utils.reformat import to_sparse_matrix
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import pandas as pd
 import tensorflow.compat.v1 as tf
-tf.disable_eager_execution()
 
 
-def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col, keyphrase_vector_col, df_train, df_valid, keyphrase_names, params, save_path):
+def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col, keyphrase_vector_col, df_train, df_valid, keyphrase_names, params, save_path, store=None, keyphrase_matrix=None, jit_compile=False):
     progress = WorkSplitter()
     table_path = load_yaml('config/global.yml', key='path')['tables']
     try:
@@ -19,6 +18,9 @@ def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col,
         df = pd.DataFrame(columns=['model', 'rank', 'num_layers', 'train_batch_size', 'predict_batch_size',
                                    'lambda', 'topK', 'learning_rate', 'epoch', 'negative_sampling_size'])
 
+    shared_structures = (store.sampler_structures() if store is not None
+                         else {'keyphrase_matrix': keyphrase_matrix})
+
     for algorithm in params['models']:
 
         for rank in params['rank']:
@@ -58,9 +60,7 @@ def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col,
 
                                         progress.subsection("Initializing Negative Sampler")
 
-                                        negative_sampler = Negative_Sampler(df_train[[user_col,
-                                                                                      item_col,
-                                                                                      keyphrase_vector_col]],
+                                        negative_sampler = Negative_Sampler(df_train,
                                                                             user_col,
                                                                             item_col,
                                                                             rating_col,
@@ -68,7 +68,9 @@ def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col,
                                                                             num_items=num_items,
                                                                             batch_size=train_batch_size,
                                                                             num_keyphrases=len(keyphrase_names),
-                                                                            negative_sampling_size=negative_sampling_size)
+                                                                            negative_sampling_size=negative_sampling_size,
+                                                                            **shared_structures)
+                                        negative_sampler = Prefetch_Sampler(negative_sampler)
 
                                         model = params['models'][algorithm](num_users=num_users,
                                                                             num_items=num_items,
@@ -77,7 +79,8 @@ def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col,
                                                                             num_layers=num_layers,
                                                                             negative_sampler=negative_sampler,
                                                                             lamb=lamb,
-                                                                            learning_rate=learning_rate)
+                                                                            learning_rate=learning_rate,
+                                                                            jit_compile=jit_compile)
 
                                         progress.subsection("Training")
 
@@ -125,13 +128,14 @@ def hyper_parameter_tuning(num_users, num_items, user_col, item_col, rating_col,
 
                                         df = df.append(result_dict, ignore_index=True)
 
-                                        model.sess.close()
+                                        model.close()
+                                        negative_sampler.close()
                                         tf.reset_default_graph()
 
                                         save_dataframe_csv(df, table_path, save_path)
 
 
-def explanation_parameter_tuning(num_users, num_items, user_col, item_col, rating_col, keyphrase_vector_col, df_train, df_valid, keyphrase_names, params, save_path):
+def explanation_parameter_tuning(num_users, num_items, user_col, item_col, rating_col, keyphrase_vector_col, df_train, df_valid, keyphrase_names, params, save_path, store=None, keyphrase_matrix=None, jit_compile=False):
     progress = WorkSplitter()
     table_path = load_yaml('config/global.yml', key='path')['tables']
     try:
@@ -140,6 +144,10 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
         df = pd.DataFrame(columns=['model', 'rank', 'num_layers', 'train_batch_size', 'predict_batch_size',
                                    'lambda', 'topK', 'learning_rate', 'epoch', 'negative_sampling_size'])
 
+    ground_truth = prepare_explanation_ground_truth(df_valid, user_col, item_col, rating_col, keyphrase_vector_col)
+    shared_structures = (store.sampler_structures() if store is not None
+                         else {'keyphrase_matrix': keyphrase_matrix})
+
     for algorithm in params['models']:
 
         for rank in params['rank']:
@@ -179,9 +187,7 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
 
                                         progress.subsection("Initializing Negative Sampler")
 
-                                        negative_sampler = Negative_Sampler(df_train[[user_col,
-                                                                                      item_col,
-                                                                                      keyphrase_vector_col]],
+                                        negative_sampler = Negative_Sampler(df_train,
                                                                             user_col,
                                                                             item_col,
                                                                             rating_col,
@@ -189,7 +195,9 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
                                                                             num_items=num_items,
                                                                             batch_size=train_batch_size,
                                                                             num_keyphrases=len(keyphrase_names),
-                                                                            negative_sampling_size=negative_sampling_size)
+                                                                            negative_sampling_size=negative_sampling_size,
+                                                                            **shared_structures)
+                                        negative_sampler = Prefetch_Sampler(negative_sampler)
 
                                         model = params['models'][algorithm](num_users=num_users,
                                                                             num_items=num_items,
@@ -198,7 +206,8 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
                                                                             num_layers=num_layers,
                                                                             negative_sampler=negative_sampler,
                                                                             lamb=lamb,
-                                                                            learning_rate=learning_rate)
+                                                                            learning_rate=learning_rate,
+                                                                            jit_compile=jit_compile)
 
                                         progress.subsection("Training")
 
@@ -225,7 +234,8 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
                                                                                   user_col,
                                                                                   item_col,
                                                                                   rating_col,
-                                                                                  keyphrase_vector_col)
+                                                                                  keyphrase_vector_col,
+                                                                                  ground_truth=ground_truth)
 
                                         result_dict = {'model': algorithm,
                                                        'rank': rank,
@@ -243,7 +253,8 @@ def explanation_parameter_tuning(num_users, num_items, user_col, item_col, ratin
 
                                         df = df.append(result_dict, ignore_index=True)
 
-                                        model.sess.close()
+                                        model.close()
+                                        negative_sampler.close()
                                         tf.reset_default_graph()
 
                                         save_dataframe_csv(df, table_path, save_path)
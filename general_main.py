@@ -1,13 +1,13 @@
 from evaluation.general_performance import evaluate, evaluate_explanation
+from models.optimizers import optimizers
 from prediction.predictor import predict_elementwise, predict_explanation
 from utils.argcheck import check_float_positive, check_int_positive
-from utils.modelnames import models
+from utils.io import load_dataset_counts, load_split, load_split_matrix
 from utils.progress import WorkSplitter
 from utils.reformat import to_sparse_matrix
-from utils.sampler import Negative_Sampler
+from utils.sampler import Negative_Sampler, Prefetch_Sampler
 
 import argparse
-import ast
 import pandas as pd
 
 
@@ -18,7 +18,9 @@ def main(args):
     progress.section("Parameter Setting")
     print("Data Directory: {}".format(args.data_dir))
     print("Algorithm: {}".format(args.model))
+    print("Backend: {}".format(args.backend))
     print("Learning Rate: {}".format(args.learning_rate))
+    print("Optimizer: {}".format(args.optimizer))
     print("Epoch: {}".format(args.epoch))
     print("Number of Top Items Evaluated in Recommendation: {}".format(args.topk))
     print("Lambda: {}".format(args.lamb))
@@ -30,26 +32,28 @@ def main(args):
     print("Enable Validation: {}".format(args.enable_validation))
 
     progress.section("Load Data")
-    num_users = pd.read_csv(args.data_dir + args.user_col + '.csv')[args.user_col].nunique()
-    num_items = pd.read_csv(args.data_dir + args.item_col + '.csv')[args.item_col].nunique()
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
     print("Dataset U-I Dimensions: ({}, {})".format(num_users, num_items))
 
-    df_train = pd.read_csv(args.data_dir + args.train_set)
-    df_train = df_train[df_train[args.rating_col] == 1]
-    df_train[args.keyphrase_vector_col] = df_train[args.keyphrase_vector_col].apply(ast.literal_eval)
+    keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
+    num_keyphrases = len(keyphrase_names)
+
+    df_train, train_keyphrases = load_split_matrix(args.data_dir, args.train_set, args.user_col, args.item_col,
+                                                   args.rating_col, args.keyphrase_vector_col, num_keyphrases)
+    positive = (df_train[args.rating_col] == 1).values
+    df_train = df_train[positive]
+    train_keyphrases = train_keyphrases[positive]
 
     if args.enable_validation:
-        df_valid = pd.read_csv(args.data_dir + args.valid_set)
+        df_valid = load_split(args.data_dir, args.valid_set, args.user_col, args.item_col, args.rating_col,
+                              args.keyphrase_vector_col)
     else:
-        df_valid = pd.read_csv(args.data_dir + args.test_set)
-
-    keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
-    num_keyphrases = len(keyphrase_names)
+        df_valid = load_split(args.data_dir, args.test_set, args.user_col, args.item_col, args.rating_col,
+                              args.keyphrase_vector_col)
 
     progress.section("Initialize Negative Sampler")
     negative_sampler = Negative_Sampler(df_train[[args.user_col,
-                                                  args.item_col,
-                                                  args.keyphrase_vector_col]],
+                                                  args.item_col]],
                                         args.user_col,
                                         args.item_col,
                                         args.rating_col,
@@ -57,9 +61,17 @@ def main(args):
                                         num_items,
                                         batch_size=args.train_batch_size,
                                         num_keyphrases=num_keyphrases,
-                                        negative_sampling_size=args.negative_sampling_size)
+                                        negative_sampling_size=args.negative_sampling_size,
+                                        keyphrase_matrix=train_keyphrases)
+    negative_sampler = Prefetch_Sampler(negative_sampler)
 
     progress.section("Train")
+    if args.backend == 'tf2':
+        # Imported on demand, the graph-mode models disable eager execution when imported
+        from models.tf2 import models
+    else:
+        from utils.modelnames import models
+
     model = models[args.model](num_users=num_users,
                                num_items=num_items,
                                text_dim=num_keyphrases,
@@ -67,13 +79,16 @@ def main(args):
                                num_layers=1,
                                negative_sampler=negative_sampler,
                                lamb=args.lamb,
-                               learning_rate=args.learning_rate)
+                               learning_rate=args.learning_rate,
+                               optimizer=optimizers[args.optimizer],
+                               jit_compile=args.jit_compile)
 
     model.train_model(df_train,
                       user_col=args.user_col,
                       item_col=args.item_col,
                       rating_col=args.rating_col,
                       epoch=args.epoch)
+    negative_sampler.close()
 
     progress.section("Predict")
     prediction, explanation = predict_elementwise(model,
@@ -125,6 +140,9 @@ if __name__ == "__main__":
     # Commandline arguments
     parser = argparse.ArgumentParser(description="Deep Language-based Critiquing")
 
+    parser.add_argument('--backend', dest='backend', default="tf1", choices=['tf1', 'tf2'],
+                        help='Graph-mode (tf1) or compiled eager (tf2) models. (default: %(default)s)')
+
     parser.add_argument('--data_dir', dest='data_dir', default="data/beer/",
                         help='Directory path to the dataset. (default: %(default)s)')
 
@@ -139,6 +157,9 @@ if __name__ == "__main__":
     parser.add_argument('--item_col', dest='item_col', default="ItemIndex",
                         help='Item column name in the dataset. (default: %(default)s)')
 
+    parser.add_argument('--jit_compile', dest='jit_compile', action='store_true',
+                        help='Boolean flag indicating if the tf2 training step is compiled with XLA.')
+
     parser.add_argument('--keyphrase', dest='keyphrase_set', default="KeyPhrases.csv",
                         help='Keyphrase set csv file. (default: %(default)s)')
 
@@ -163,6 +184,10 @@ if __name__ == "__main__":
                         type=check_int_positive,
                         help='The number of negative sampling. (default: %(default)s)')
 
+    parser.add_argument('--optimizer', dest='optimizer', default="Adam", choices=list(optimizers),
+                        help='Optimizer used in training models, LazyAdam and Adagrad only update the embedding '
+                             'rows in the batch. (default: %(default)s)')
+
     parser.add_argument('--predict_batch_size', dest='predict_batch_size', default=128,
                         type=check_int_positive,
                         help='Batch size used in prediction. (default: %(default)s)')
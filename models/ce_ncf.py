@@ -1,3 +1,6 @@
+from models.losses import sparse_mean_squared_error, sparse_row_max
+from models.numpy_model import BatchCritique, ClosedFormCritique
+from models.pipeline import Catalog_Inference, critique_layers, export_weights, Input_Pipeline
 from tqdm import tqdm
 from utils.reformat import to_sparse_matrix, to_svd
 
@@ -6,6 +9,8 @@ tf.disable_eager_execution()
 from tensorflow.compat.v1.train import AdamOptimizer
 
 class CENCF(object):
+    closed_form_critique = True
+
     def __init__(self,
                  num_users,
                  num_items,
@@ -34,10 +39,11 @@ class CENCF(object):
 
     def get_graph(self):
 
-        self.users_index = tf.placeholder(tf.int32, [None], name='user_id')
-        self.items_index = tf.placeholder(tf.int32, [None], name='item_id')
-        self.rating = tf.placeholder(tf.int32, [None], name='rating')
-        self.keyphrase_vector = tf.placeholder(tf.int32, [None, self.text_dim], name='keyphrases_vector')
+        self.pipeline = Input_Pipeline(self.text_dim, keyphrases=True)
+        self.users_index = self.pipeline.users_index
+        self.items_index = self.pipeline.items_index
+        self.rating = self.pipeline.rating
+        self.keyphrase_vector = self.pipeline.keyphrase_vector
         self.modified_keyphrase = tf.placeholder(tf.float32, [None, self.text_dim], name='modified_keyphrases')
 
         with tf.variable_scope("embeddings"):
@@ -54,10 +60,13 @@ class CENCF(object):
 
         with tf.variable_scope("residual"):
             hi = tf.concat([users, items], axis=1)
+            self.residual_layers = []
             for i in range(self.num_layers):
-                ho = tf.layers.dense(inputs=hi, units=self.embed_dim*2,
-                                     kernel_regularizer=tf.keras.regularizers.l2(self.lamb),
-                                     activation=tf.nn.relu)
+                layer = tf.layers.Dense(units=self.embed_dim*2,
+                                        kernel_regularizer=tf.keras.regularizers.l2(self.lamb),
+                                        activation=tf.nn.relu)
+                self.residual_layers.append(layer)
+                ho = layer.apply(hi)
                 #hi = tf.concat([hi, ho], axis=1)
                 hi = ho
 
@@ -99,8 +108,11 @@ class CENCF(object):
             self.modified_rating_prediction = rating_prediction
             self.modified_keyphrase_prediction = keyphrase_prediction
 
+        self.catalog = Catalog_Inference(self.user_embeddings, self.item_embeddings, self.users_index,
+                                         self.residual_layers, self.text_dim)
+
         with tf.variable_scope("losses"):
-            keyphrase_condition = tf.stop_gradient(tf.cast(tf.reduce_max(self.keyphrase_vector, axis=1), tf.float32))
+            keyphrase_condition = sparse_row_max(self.keyphrase_vector)
 
             with tf.variable_scope("latent_reconstruction_loss"):
                 latent_loss = tf.losses.mean_squared_error(labels=latent, predictions=reconstructed_latent) * keyphrase_condition
@@ -112,8 +124,8 @@ class CENCF(object):
                                                            predictions=self.rating_prediction)
 
             with tf.variable_scope("keyphrase_loss"):
-                keyphrase_loss = tf.losses.mean_squared_error(labels=self.keyphrase_vector,
-                                                              predictions=self.keyphrase_prediction) * keyphrase_condition
+                keyphrase_loss = sparse_mean_squared_error(labels=self.keyphrase_vector,
+                                                           predictions=self.keyphrase_prediction) * keyphrase_condition
 
             with tf.variable_scope("l2"):
                 l2_loss = tf.losses.get_regularization_loss()
@@ -128,34 +140,34 @@ class CENCF(object):
             self.train = self.optimizer(learning_rate=self.learning_rate).minimize(self.loss)
 
     def train_model(self, df, user_col, item_col, rating_col, epoch=100,
-                    batches=None, init_embedding=True, **unused):
+                    batches=None, init_embedding=True, log_every=100, **unused):
+
+        self.catalog.invalidate()
 
         if init_embedding:
             self.get_user_item_embeddings(df, user_col, item_col, rating_col)
 
         if batches is None:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
         # Training
         pbar = tqdm(range(epoch))
         for i in pbar:
-            for batch in batches:
-                feed_dict = {self.users_index: batch[0],
-                             self.items_index: batch[1],
-                             self.rating: batch[2],
-                             self.keyphrase_vector: batch[3].todense()}
-
-                training, loss = self.sess.run([self.train, self.loss], feed_dict=feed_dict)
-                pbar.set_description("loss:{}".format(loss))
+            losses = self.pipeline.run_epoch(self.sess, batches, self.train, self.loss,
+                                             log_every=log_every)
+            if losses:
+                pbar.set_description("loss:{}".format(losses[-1]))
 
             #if (i+1) % 5 == 0:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
-    def predict(self, inputs):
+    def predict(self, inputs, explanation=True):
         user_index = inputs[:, 0]
         item_index = inputs[:, 1]
         feed_dict = {self.users_index: user_index,
                      self.items_index: item_index}
+        if not explanation:
+            return [self.sess.run(self.rating_prediction, feed_dict=feed_dict), None]
         return self.sess.run([self.rating_prediction,
                               self.keyphrase_prediction],
                              feed_dict=feed_dict)
@@ -185,6 +197,26 @@ class CENCF(object):
 
         return mean, modified_mean
 
+    def predict_all_items(self, user_index, explanation=True):
+        """
+        Rating and keyphrase predictions of the given users against the whole catalog, see Catalog_Inference.
+        """
+        return self.catalog.predict(self.sess, self.users_index, user_index, explanation)
+
+    def critique_users(self, user_index):
+        """
+        :return: BatchCritique of the given users over all items, applying critiques in closed form to the latents
+        of one forward pass instead of running refine_predict.
+        """
+        z, rating, explanation = self.catalog.run(self.sess, [self.catalog.latent,
+                                                              self.catalog.rating_prediction,
+                                                              self.catalog.keyphrase_prediction],
+                                                  {self.users_index: user_index})
+        return BatchCritique(z, z, *critique_layers(self.sess), rating=rating, explanation=explanation)
+
+    def critique(self, user_index):
+        return ClosedFormCritique(self.critique_users([user_index]))
+
     def get_user_item_embeddings(self, df, user_col, item_col, rating_col):
         R = to_sparse_matrix(df, self.num_users, self.num_items, user_col, item_col, rating_col)
         user_embedding, item_embedding = to_svd(R, self.embed_dim)
@@ -196,8 +228,17 @@ class CENCF(object):
         save_path = saver.save(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model saved in path: %s" % save_path)
 
+    def export_model(self, path, name):
+        export_weights(self.sess, self.user_embeddings, self.item_embeddings, 'CE-NCF', path, name)
+
     def load_model(self, path, name):
         saver = tf.train.Saver()
         saver.restore(self.sess, "{}/{}/model.ckpt".format(path, name))
+        self.catalog.invalidate()
         print("Model restored.")
 
+    def get_embeddings(self):
+        return self.sess.run([self.user_embeddings, self.item_embeddings])
+
+    def close(self):
+        self.sess.close()
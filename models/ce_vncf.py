@@ -1,11 +1,18 @@
+from models.losses import sparse_mean_squared_error, sparse_row_max
+from models.numpy_model import BatchCritique, ClosedFormCritique
+from models.pipeline import critique_layers, export_weights, Input_Pipeline
 from tqdm import tqdm
 from utils.reformat import to_sparse_matrix, to_svd
 from tensorflow.compat.v1.train import AdamOptimizer
+
+import numpy as np
 import tensorflow.compat.v1 as tf
 tf.disable_eager_execution()
 
 
 class CEVNCF(object):
+    closed_form_critique = True
+
     def __init__(self,
                  num_users,
                  num_items,
@@ -34,10 +41,11 @@ class CEVNCF(object):
 
     def get_graph(self):
 
-        self.users_index = tf.placeholder(tf.int32, [None], name='user_id')
-        self.items_index = tf.placeholder(tf.int32, [None], name='item_id')
-        self.rating = tf.placeholder(tf.int32, [None], name='rating')
-        self.keyphrase_vector = tf.placeholder(tf.int32, [None, self.text_dim], name='keyphrases_vector')
+        self.pipeline = Input_Pipeline(self.text_dim, keyphrases=True)
+        self.users_index = self.pipeline.users_index
+        self.items_index = self.pipeline.items_index
+        self.rating = self.pipeline.rating
+        self.keyphrase_vector = self.pipeline.keyphrase_vector
         self.modified_keyphrase = tf.placeholder(tf.float32, [None, self.text_dim], name='modified_keyphrases')
         self.sampling = tf.placeholder(tf.bool)
         self.corruption = tf.placeholder(tf.float32)
@@ -73,6 +81,7 @@ class CEVNCF(object):
             self.z = tf.cond(self.sampling, lambda: self.mean + self.stddev * epsilon, lambda: self.mean)
 
             latent = tf.stop_gradient(tf.concat([self.mean, logstd], axis=1))
+            self.latent = latent
 
         with tf.variable_scope("prediction", reuse=False):
             rating_prediction = tf.layers.dense(inputs=self.z, units=1,
@@ -112,7 +121,7 @@ class CEVNCF(object):
 
         with tf.variable_scope("losses"):
 
-            keyphrase_condition = tf.stop_gradient(tf.cast(tf.reduce_max(self.keyphrase_vector, axis=1), tf.float32))
+            keyphrase_condition = sparse_row_max(self.keyphrase_vector)
 
             with tf.variable_scope('kl-divergence'):
                 kl = self._kl_diagnormal_stdnormal(self.mean, logstd)
@@ -127,8 +136,8 @@ class CEVNCF(object):
                                                            predictions=self.rating_prediction)
 
             with tf.variable_scope("keyphrase_loss"):
-                keyphrase_loss = tf.losses.mean_squared_error(labels=self.keyphrase_vector,
-                                                              predictions=self.keyphrase_prediction) * keyphrase_condition
+                keyphrase_loss = sparse_mean_squared_error(labels=self.keyphrase_vector,
+                                                           predictions=self.keyphrase_prediction) * keyphrase_condition
 
             with tf.variable_scope("l2"):
                 l2_loss = tf.losses.get_regularization_loss()
@@ -150,38 +159,35 @@ class CEVNCF(object):
         return kl
 
     def train_model(self, df, user_col, item_col, rating_col, epoch=100,
-                    batches=None, init_embedding=True, **unused):
+                    batches=None, init_embedding=True, log_every=100, **unused):
 
         if init_embedding:
             self.get_user_item_embeddings(df, user_col, item_col, rating_col)
 
         if batches is None:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
         # Training
         pbar = tqdm(range(epoch))
         for i in pbar:
-            for batch in batches:
-                feed_dict = {self.users_index: batch[0],
-                             self.items_index: batch[1],
-                             self.corruption: 0.1,
-                             self.rating: batch[2],
-                             self.keyphrase_vector: batch[3].todense(),
-                             self.sampling: True}
-
-                training, loss = self.sess.run([self.train, self.loss], feed_dict=feed_dict)
-                pbar.set_description("loss:{}".format(loss))
+            losses = self.pipeline.run_epoch(self.sess, batches, self.train, self.loss,
+                                             feed_dict={self.corruption: 0.1, self.sampling: True},
+                                             log_every=log_every)
+            if losses:
+                pbar.set_description("loss:{}".format(losses[-1]))
 
             #if (i+1) % 5 == 0:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
-    def predict(self, inputs):
+    def predict(self, inputs, explanation=True):
         user_index = inputs[:, 0]
         item_index = inputs[:, 1]
         feed_dict = {self.users_index: user_index,
                      self.items_index: item_index,
                      self.sampling: False,
                      self.corruption: 0}
+        if not explanation:
+            return [self.sess.run(self.rating_prediction, feed_dict=feed_dict), None]
         return self.sess.run([self.rating_prediction,
                               self.keyphrase_prediction],
                              feed_dict=feed_dict)
@@ -214,6 +220,24 @@ class CEVNCF(object):
 
         return mean, modified_mean
 
+    def critique_users(self, user_index):
+        """
+        :return: BatchCritique of the given users over all items, applying critiques in closed form to the latents
+        of one forward pass instead of running refine_predict.
+        """
+        feed_dict = {self.users_index: np.repeat(user_index, self.num_items),
+                     self.items_index: np.tile(np.arange(self.num_items), len(user_index)),
+                     self.sampling: False,
+                     self.corruption: 0}
+        shape = [len(user_index), self.num_items, -1]
+        z, latent, rating, explanation = self.sess.run([self.z, self.latent, self.rating_prediction,
+                                                        self.keyphrase_prediction], feed_dict=feed_dict)
+        return BatchCritique(z.reshape(shape), latent.reshape(shape), *critique_layers(self.sess),
+                             rating=rating.reshape(shape[:2]), explanation=explanation.reshape(shape))
+
+    def critique(self, user_index):
+        return ClosedFormCritique(self.critique_users([user_index]))
+
     def get_user_item_embeddings(self, df, user_col, item_col, rating_col):
         R = to_sparse_matrix(df, self.num_users, self.num_items, user_col, item_col, rating_col)
         user_embedding, item_embedding = to_svd(R, self.embed_dim)
@@ -225,8 +249,16 @@ class CEVNCF(object):
         save_path = saver.save(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model saved in path: %s" % save_path)
 
+    def export_model(self, path, name):
+        export_weights(self.sess, self.user_embeddings, self.item_embeddings, 'CE-VNCF', path, name)
+
     def load_model(self, path, name):
         saver = tf.train.Saver()
         saver.restore(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model restored.")
 
+    def get_embeddings(self):
+        return self.sess.run([self.user_embeddings, self.item_embeddings])
+
+    def close(self):
+        self.sess.close()
@@ -1,3 +1,5 @@
+from models.losses import sparse_mean_squared_error, sparse_row_max
+from models.pipeline import Catalog_Inference, export_weights, Input_Pipeline
 from tqdm import tqdm
 from utils.reformat import to_sparse_matrix, to_svd
 
@@ -34,10 +36,11 @@ class ENCF(object):
 
     def get_graph(self):
 
-        self.users_index = tf.placeholder(tf.int32, [None], name='user_id')
-        self.items_index = tf.placeholder(tf.int32, [None], name='item_id')
-        self.rating = tf.placeholder(tf.int32, [None], name='rating')
-        self.keyphrase_vector = tf.placeholder(tf.int32, [None, self.text_dim], name='keyphrases_vector')
+        self.pipeline = Input_Pipeline(self.text_dim, keyphrases=True)
+        self.users_index = self.pipeline.users_index
+        self.items_index = self.pipeline.items_index
+        self.rating = self.pipeline.rating
+        self.keyphrase_vector = self.pipeline.keyphrase_vector
         self.modified_keyphrase = tf.placeholder(tf.float32, [None, self.text_dim], name='modified_keyphrases')
 
         with tf.variable_scope("embeddings"):
@@ -54,10 +57,13 @@ class ENCF(object):
 
         with tf.variable_scope("residual"):
             hi = tf.concat([users, items], axis=1)
+            self.residual_layers = []
             for i in range(self.num_layers):
-                ho = tf.layers.dense(inputs=hi, units=self.embed_dim*2,
-                                     kernel_regularizer=tf.keras.regularizers.l2(scale=self.lamb),
-                                     activation=tf.nn.relu)
+                layer = tf.layers.Dense(units=self.embed_dim*2,
+                                        kernel_regularizer=tf.keras.regularizers.l2(scale=self.lamb),
+                                        activation=tf.nn.relu)
+                self.residual_layers.append(layer)
+                ho = layer.apply(hi)
                 #hi = tf.concat([hi, ho], axis=1)
                 hi = ho
 
@@ -72,8 +78,11 @@ class ENCF(object):
             self.rating_prediction = rating_prediction
             self.keyphrase_prediction = keyphrase_prediction
 
+        self.catalog = Catalog_Inference(self.user_embeddings, self.item_embeddings, self.users_index,
+                                         self.residual_layers, self.text_dim)
+
         with tf.variable_scope("losses"):
-            keyphrase_condition = tf.stop_gradient(tf.cast(tf.reduce_max(self.keyphrase_vector, axis=1), tf.float32))
+            keyphrase_condition = sparse_row_max(self.keyphrase_vector)
 
             with tf.variable_scope("rating_loss"):
                 # rating_loss = tf.losses.sigmoid_cross_entropy(multi_class_labels=tf.reshape(self.rating, [-1, 1]),
@@ -82,8 +91,8 @@ class ENCF(object):
                                                            predictions=self.rating_prediction)
 
             with tf.variable_scope("keyphrase_loss"):
-                keyphrase_loss = tf.losses.mean_squared_error(labels=self.keyphrase_vector,
-                                                              predictions=self.keyphrase_prediction) * keyphrase_condition
+                keyphrase_loss = sparse_mean_squared_error(labels=self.keyphrase_vector,
+                                                           predictions=self.keyphrase_prediction) * keyphrase_condition
 
             with tf.variable_scope("l2"):
                 l2_loss = tf.losses.get_regularization_loss()
@@ -97,38 +106,44 @@ class ENCF(object):
             self.train = self.optimizer(learning_rate=self.learning_rate).minimize(self.loss)
 
     def train_model(self, df, user_col, item_col, rating_col, epoch=100,
-                    batches=None, init_embedding=True, **unused):
+                    batches=None, init_embedding=True, log_every=100, **unused):
+
+        self.catalog.invalidate()
 
         if init_embedding:
             self.get_user_item_embeddings(df, user_col, item_col, rating_col)
 
         if batches is None:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
         # Training
         pbar = tqdm(range(epoch))
         for i in pbar:
-            for batch in batches:
-                feed_dict = {self.users_index: batch[0],
-                             self.items_index: batch[1],
-                             self.rating: batch[2],
-                             self.keyphrase_vector: batch[3].todense()}
-
-                training, loss = self.sess.run([self.train, self.loss], feed_dict=feed_dict)
-                pbar.set_description("loss:{}".format(loss))
+            losses = self.pipeline.run_epoch(self.sess, batches, self.train, self.loss,
+                                             log_every=log_every)
+            if losses:
+                pbar.set_description("loss:{}".format(losses[-1]))
 
             #if (i+1) % 5 == 0:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
-    def predict(self, inputs):
+    def predict(self, inputs, explanation=True):
         user_index = inputs[:, 0]
         item_index = inputs[:, 1]
         feed_dict = {self.users_index: user_index,
                      self.items_index: item_index}
+        if not explanation:
+            return [self.sess.run(self.rating_prediction, feed_dict=feed_dict), None]
         return self.sess.run([self.rating_prediction,
                               self.keyphrase_prediction],
                              feed_dict=feed_dict)
 
+    def predict_all_items(self, user_index, explanation=True):
+        """
+        Rating and keyphrase predictions of the given users against the whole catalog, see Catalog_Inference.
+        """
+        return self.catalog.predict(self.sess, self.users_index, user_index, explanation)
+
     def get_user_item_embeddings(self, df, user_col, item_col, rating_col):
         R = to_sparse_matrix(df, self.num_users, self.num_items, user_col, item_col, rating_col)
         user_embedding, item_embedding = to_svd(R, self.embed_dim)
@@ -140,8 +155,17 @@ class ENCF(object):
         save_path = saver.save(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model saved in path: %s" % save_path)
 
+    def export_model(self, path, name):
+        export_weights(self.sess, self.user_embeddings, self.item_embeddings, 'E-NCF', path, name)
+
     def load_model(self, path, name):
         saver = tf.train.Saver()
         saver.restore(self.sess, "{}/{}/model.ckpt".format(path, name))
+        self.catalog.invalidate()
         print("Model restored.")
 
+    def get_embeddings(self):
+        return self.sess.run([self.user_embeddings, self.item_embeddings])
+
+    def close(self):
+        self.sess.close()
@@ -1,3 +1,5 @@
+from models.losses import sparse_mean_squared_error, sparse_row_max
+from models.pipeline import export_weights, Input_Pipeline
 from tqdm import tqdm
 from utils.reformat import to_sparse_matrix, to_svd
 
@@ -34,10 +36,11 @@ class EVNCF(object):
 
     def get_graph(self):
 
-        self.users_index = tf.placeholder(tf.int32, [None], name='user_id')
-        self.items_index = tf.placeholder(tf.int32, [None], name='item_id')
-        self.rating = tf.placeholder(tf.int32, [None], name='rating')
-        self.keyphrase_vector = tf.placeholder(tf.int32, [None, self.text_dim], name='keyphrases_vector')
+        self.pipeline = Input_Pipeline(self.text_dim, keyphrases=True)
+        self.users_index = self.pipeline.users_index
+        self.items_index = self.pipeline.items_index
+        self.rating = self.pipeline.rating
+        self.keyphrase_vector = self.pipeline.keyphrase_vector
         self.modified_keyphrase = tf.placeholder(tf.float32, [None, self.text_dim], name='modified_keyphrases')
         self.sampling = tf.placeholder(tf.bool)
         self.corruption = tf.placeholder(tf.float32)
@@ -84,7 +87,7 @@ class EVNCF(object):
             self.keyphrase_prediction = keyphrase_prediction
 
         with tf.variable_scope("losses"):
-            keyphrase_condition = tf.stop_gradient(tf.cast(tf.reduce_max(self.keyphrase_vector, axis=1), tf.float32))
+            keyphrase_condition = sparse_row_max(self.keyphrase_vector)
 
             with tf.variable_scope('kl-divergence'):
                 kl = self._kl_diagnormal_stdnormal(self.mean, logstd)
@@ -96,8 +99,8 @@ class EVNCF(object):
                                                            predictions=self.rating_prediction)
 
             with tf.variable_scope("keyphrase_loss"):
-                keyphrase_loss = tf.losses.mean_squared_error(labels=self.keyphrase_vector,
-                                                              predictions=self.keyphrase_prediction) * keyphrase_condition
+                keyphrase_loss = sparse_mean_squared_error(labels=self.keyphrase_vector,
+                                                           predictions=self.keyphrase_prediction) * keyphrase_condition
 
             with tf.variable_scope("l2"):
                 l2_loss = tf.losses.get_regularization_loss()
@@ -119,38 +122,35 @@ class EVNCF(object):
         return kl
 
     def train_model(self, df, user_col, item_col, rating_col, epoch=100,
-                    batches=None, init_embedding=True, **unused):
+                    batches=None, init_embedding=True, log_every=100, **unused):
 
         if init_embedding:
             self.get_user_item_embeddings(df, user_col, item_col, rating_col)
 
         if batches is None:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
         # Training
         pbar = tqdm(range(epoch))
         for i in pbar:
-            for batch in batches:
-                feed_dict = {self.users_index: batch[0],
-                             self.items_index: batch[1],
-                             self.corruption: 0.1,
-                             self.rating: batch[2],
-                             self.keyphrase_vector: batch[3].todense(),
-                             self.sampling: True}
-
-                training, loss = self.sess.run([self.train, self.loss], feed_dict=feed_dict)
-                pbar.set_description("loss:{}".format(loss))
+            losses = self.pipeline.run_epoch(self.sess, batches, self.train, self.loss,
+                                             feed_dict={self.corruption: 0.1, self.sampling: True},
+                                             log_every=log_every)
+            if losses:
+                pbar.set_description("loss:{}".format(losses[-1]))
 
             #if (i+1) % 5 == 0:
-            batches = self.negative_sampler.get_batches()
+            batches = self.negative_sampler.iterate_batches()
 
-    def predict(self, inputs):
+    def predict(self, inputs, explanation=True):
         user_index = inputs[:, 0]
         item_index = inputs[:, 1]
         feed_dict = {self.users_index: user_index,
                      self.items_index: item_index,
                      self.sampling: False,
                      self.corruption: 0}
+        if not explanation:
+            return [self.sess.run(self.rating_prediction, feed_dict=feed_dict), None]
         return self.sess.run([self.rating_prediction,
                               self.keyphrase_prediction],
                              feed_dict=feed_dict)
@@ -166,8 +166,16 @@ class EVNCF(object):
         save_path = saver.save(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model saved in path: %s" % save_path)
 
+    def export_model(self, path, name):
+        export_weights(self.sess, self.user_embeddings, self.item_embeddings, 'E-VNCF', path, name)
+
     def load_model(self, path, name):
         saver = tf.train.Saver()
         saver.restore(self.sess, "{}/{}/model.ckpt".format(path, name))
         print("Model restored.")
 
+    def get_embeddings(self):
+        return self.sess.run([self.user_embeddings, self.item_embeddings])
+
+    def close(self):
+        self.sess.close()
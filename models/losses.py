@@ -0,0 +1,24 @@
+import tensorflow.compat.v1 as tf
+
+
+def sparse_mean_squared_error(labels, predictions):
+    """
+    tf.losses.mean_squared_error of dense predictions against sparse labels, without densifying the labels.
+    Entries without a label contribute their squared prediction, so only the labelled entries are gathered.
+    :param labels: SparseTensor of the same dense shape as predictions, without duplicate indices.
+    """
+    label_predictions = tf.gather_nd(predictions, labels.indices)
+    squared_error = (tf.reduce_sum(tf.square(predictions))
+                     - tf.reduce_sum(tf.square(label_predictions))
+                     + tf.reduce_sum(tf.square(label_predictions - tf.cast(labels.values, predictions.dtype))))
+    return squared_error / tf.cast(tf.size(predictions), predictions.dtype)
+
+
+def sparse_row_max(labels):
+    """
+    :return: Row maxima of non-negative sparse labels as float32, zero for empty rows, as
+    tf.reduce_max(tf.sparse.to_dense(labels), axis=1) would give.
+    """
+    row_max = tf.math.unsorted_segment_max(tf.cast(labels.values, tf.float32), labels.indices[:, 0],
+                                           num_segments=labels.dense_shape[0])
+    return tf.stop_gradient(tf.maximum(row_max, 0.))
@@ -0,0 +1,205 @@
+import numpy as np
+
+
+class NumpyModel(object):
+    """
+    TensorFlow-free inference for weights written by export_model of NCF, VNCF, E-NCF, E-VNCF, CE-NCF and CE-VNCF.
+    """
+    def __init__(self, path, name):
+        weights = np.load("{}/{}/model.npz".format(path, name))
+        self.model = str(weights['model'])
+        self.variational = self.model in ['VNCF', 'E-VNCF', 'CE-VNCF']
+
+        self.user_embeddings = weights['user_embeddings']
+        self.item_embeddings = weights['item_embeddings']
+        self.num_users, self.embed_dim = self.user_embeddings.shape
+        self.num_items = self.item_embeddings.shape[0]
+
+        self.layers = []
+        layer_name = 'residual/dense'
+        while layer_name + '/kernel' in weights:
+            self.layers.append((weights[layer_name + '/kernel'], weights[layer_name + '/bias']))
+            layer_name = 'residual/dense_{}'.format(len(self.layers))
+
+        self.rating_layer = (weights['prediction/rating_prediction/kernel'],
+                             weights['prediction/rating_prediction/bias'])
+        self.keyphrase_layer = (weights['prediction/keyphrase_prediction/kernel'],
+                                weights['prediction/keyphrase_prediction/bias'])
+        self.text_dim = self.keyphrase_layer[0].shape[1]
+
+        if 'looping/latent_reconstruction/kernel' in weights:
+            self.reconstruction_layer = (weights['looping/latent_reconstruction/kernel'],
+                                         weights['looping/latent_reconstruction/bias'])
+        else:
+            self.reconstruction_layer = None
+        # Critiques of models with a looping layer are applied in closed form, see BatchCritique
+        self.closed_form_critique = self.reconstruction_layer is not None
+
+    @staticmethod
+    def dense(inputs, layer):
+        kernel, bias = layer
+        # One 2-D product, dot of higher-rank inputs such as the [users, items, width] latents of BatchCritique
+        # does not use BLAS
+        outputs = inputs.reshape(-1, inputs.shape[-1]).dot(kernel) + bias
+        return outputs.reshape(inputs.shape[:-1] + (kernel.shape[1],))
+
+    def get_latent(self, inputs):
+        """
+        :return: Latent code fed to the prediction heads and the latent the looping layer is trained against.
+        """
+        hi = np.concatenate([self.user_embeddings[inputs[:, 0]], self.item_embeddings[inputs[:, 1]]], axis=1)
+        for layer in self.layers:
+            hi = self.dense(hi, layer)
+            if not self.variational:
+                hi = np.maximum(hi, 0)
+
+        if not self.variational:
+            return hi, hi
+
+        mean = np.maximum(hi[:, :self.embed_dim*2], 0)
+        logstd = np.tanh(hi[:, self.embed_dim*2:])*3
+        return mean, np.concatenate([mean, logstd], axis=1)
+
+    def predict(self, inputs, explanation=True):
+        z, _ = self.get_latent(inputs)
+        rating = self.dense(z, self.rating_layer)
+        if not explanation:
+            return [rating, None]
+        return [rating, self.dense(z, self.keyphrase_layer)]
+
+    def refine_predict(self, inputs, critiqued):
+        _, latent = self.get_latent(inputs)
+        modified_latent = (latent + np.maximum(self.dense(critiqued, self.reconstruction_layer), 0))/2.0
+        if self.variational:
+            modified_latent = modified_latent[:, :self.embed_dim*2]
+
+        return self.dense(modified_latent, self.rating_layer), self.dense(modified_latent, self.keyphrase_layer)
+
+    def density_shifting_estimate(self, inputs, critiqued):
+        mean, _ = self.get_latent(inputs)
+        modified_mean = np.maximum(self.dense(critiqued, self.reconstruction_layer), 0)[:, :self.embed_dim*2]
+
+        return mean, modified_mean
+
+    def critique_users(self, user_index):
+        """
+        :return: BatchCritique of the given users over all items, requires a looping layer (CE-NCF, CE-VNCF).
+        """
+        inputs = np.stack(np.broadcast_arrays(np.asarray(user_index)[:, None], np.arange(self.num_items)[None, :]),
+                          axis=-1).reshape(-1, 2)
+        z, latent = self.get_latent(inputs)
+        return BatchCritique(z.reshape(len(user_index), self.num_items, -1),
+                             latent.reshape(len(user_index), self.num_items, -1),
+                             self.rating_layer, self.keyphrase_layer, self.reconstruction_layer)
+
+    def critique(self, user_index):
+        """
+        :return: ClosedFormCritique of the given user over all items, requires a looping layer (CE-NCF, CE-VNCF).
+        """
+        return ClosedFormCritique(self.critique_users([user_index]))
+
+
+class BatchCritique(object):
+    """
+    Critiquing of a batch of users over all items without re-running the network.
+
+    Critiquing keyphrase k sets column k of the predicted keyphrases to the row minimum. The looping layer is linear,
+    so its output only moves by (x[:, k] - min) * W[k]; the row minimum itself never changes under critiquing.
+    Each step therefore costs one rank-1 update, a ReLU and the rating head over the cached item projections. The
+    uncritiqued projection is folded through the keyphrase head, a width x width product instead of one over
+    text_dim.
+    """
+    def __init__(self, z, latent, rating_layer, keyphrase_layer, reconstruction_layer, rating=None, explanation=None):
+        """
+        :param z: Latent codes fed to the prediction heads, of shape [users, items, width].
+        :param latent: Latent the looping layer is trained against, of shape [users, items, >= width].
+        :param rating: Rating head output of shape [users, items], computed from z if not given.
+        :param explanation: Keyphrase head output of shape [users, items, text_dim], computed from z if not given.
+        """
+        width = z.shape[2]
+        self.rating_layer = rating_layer
+        self.keyphrase_layer = keyphrase_layer
+        self.rating = NumpyModel.dense(z, rating_layer)[:, :, 0] if rating is None else rating
+        self.explanation = NumpyModel.dense(z, keyphrase_layer) if explanation is None else explanation
+        self.row_min = np.min(self.explanation, axis=2)
+
+        kernel, bias = reconstruction_layer
+        keyphrase_kernel, keyphrase_bias = keyphrase_layer
+        self.reconstruction_kernel = kernel[:, :width]
+        self.latent = latent[:, :, :width]
+        self.projection = NumpyModel.dense(z, (keyphrase_kernel.dot(self.reconstruction_kernel),
+                                               keyphrase_bias.dot(self.reconstruction_kernel) + bias[:width]))
+        self.critiqued = np.zeros((len(z), self.explanation.shape[2]), dtype=bool)
+        self.modified_rating = self.rating
+
+        # The rating head is linear, so the share of the unchanged latent in refined ratings is computed once
+        rating_kernel, rating_bias = rating_layer
+        self.latent_rating = NumpyModel.dense(self.latent, (rating_kernel / 2.0, rating_bias))[:, :, 0]
+
+    def shift(self, users, keyphrase_index):
+        """
+        :return: Change of the looping layer output over all items when each given user critiques one keyphrase.
+        """
+        users = np.asarray(users)
+        keyphrase_index = np.broadcast_to(keyphrase_index, users.shape)
+        delta = self.explanation[users, :, keyphrase_index] - self.row_min[users]
+        delta[self.critiqued[users, keyphrase_index]] = 0
+        return delta[:, :, None] * self.reconstruction_kernel[keyphrase_index][:, None, :]
+
+    def rate(self, latent_rating, projection):
+        rating_kernel, _ = self.rating_layer
+        return latent_rating + NumpyModel.dense(np.maximum(projection, 0), (rating_kernel / 2.0, 0))[:, :, 0]
+
+    def refine(self, users, keyphrase_index):
+        """
+        Ratings of the given users after each critiques one keyphrase on top of their current critiques, without
+        keeping it. Users may repeat.
+        :return: Refined ratings of shape [len(users), items].
+        """
+        return self.rate(self.latent_rating[users], self.projection[users] - self.shift(users, keyphrase_index))
+
+    def critique(self, keyphrase_index):
+        """
+        :param keyphrase_index: Keyphrase critiqued by every user, or one per user, on top of previous critiques.
+        :return: Refined ratings of all users and items.
+        """
+        users = np.arange(len(self.projection))
+        self.projection -= self.shift(users, keyphrase_index)
+        self.critiqued[users, keyphrase_index] = True
+
+        self.modified_rating = self.rate(self.latent_rating, self.projection)
+        return self.modified_rating
+
+    def modified_explanation(self):
+        return NumpyModel.dense((self.latent + np.maximum(self.projection, 0))/2.0, self.keyphrase_layer)
+
+    def density_shifting_estimate(self):
+        return self.latent, np.maximum(self.projection, 0)
+
+
+class ClosedFormCritique(object):
+    """
+    Multi-step critiquing session of one user on top of a BatchCritique of that user alone.
+    """
+    def __init__(self, batch):
+        self.batch = batch
+        self.rating = batch.rating[0]
+        self.explanation = batch.explanation[0]
+        self.modified_rating = self.rating
+        self.critiqued_keyphrases = []
+
+    def critique(self, keyphrase_index):
+        """
+        :param keyphrase_index: Keyphrase to critique, on top of any previous critiques.
+        :return: Refined rating of all items.
+        """
+        self.modified_rating = self.batch.critique(keyphrase_index)[0]
+        self.critiqued_keyphrases.append(keyphrase_index)
+        return self.modified_rating
+
+    def modified_explanation(self):
+        return self.batch.modified_explanation()[0]
+
+    def density_shifting_estimate(self):
+        latent, modified_latent = self.batch.density_shifting_estimate()
+        return latent[0], modified_latent[0]
@@ -0,0 +1,46 @@
+from tensorflow.compat.v1.train import AdagradOptimizer, AdamOptimizer
+
+import tensorflow.compat.v1 as tf
+
+
+class LazyAdamOptimizer(AdamOptimizer):
+    """
+    Adam that only updates the rows of a sparse gradient, i.e. the embedding rows gathered by the batch, and their
+    moments. AdamOptimizer decays the moments of every row of the embedding tables at every step, so its cost grows
+    with the number of users and items rather than the batch size. Dense gradients follow AdamOptimizer.
+    """
+    def _apply_sparse_rows(self, values, var, indices):
+        dtype = var.dtype.base_dtype
+        beta1_power, beta2_power = self._get_beta_accumulators()
+        beta1_power = tf.cast(beta1_power, dtype)
+        beta2_power = tf.cast(beta2_power, dtype)
+        lr_t = tf.cast(self._lr_t, dtype)
+        beta1_t = tf.cast(self._beta1_t, dtype)
+        beta2_t = tf.cast(self._beta2_t, dtype)
+        epsilon_t = tf.cast(self._epsilon_t, dtype)
+        lr = lr_t * tf.sqrt(1 - beta2_power) / (1 - beta1_power)
+
+        m = self.get_slot(var, "m")
+        v = self.get_slot(var, "v")
+        m_rows = beta1_t * tf.gather(m, indices) + (1 - beta1_t) * values
+        v_rows = beta2_t * tf.gather(v, indices) + (1 - beta2_t) * tf.square(values)
+        m_t = tf.scatter_update(m, indices, m_rows, use_locking=self._use_locking)
+        v_t = tf.scatter_update(v, indices, v_rows, use_locking=self._use_locking)
+        var_update = tf.scatter_sub(var, indices, lr * m_rows / (tf.sqrt(v_rows) + epsilon_t),
+                                    use_locking=self._use_locking)
+        return tf.group(var_update, m_t, v_t)
+
+    def _apply_sparse(self, grad, var):
+        # Duplicate indices are summed by the base class before reaching here
+        return self._apply_sparse_rows(grad.values, var, grad.indices)
+
+    def _resource_apply_sparse(self, grad, var, indices):
+        return self._apply_sparse_rows(grad, var, indices)
+
+
+# AdagradOptimizer already applies sparse gradients to the gathered rows and their accumulators only
+optimizers = {
+    "Adam": AdamOptimizer,
+    "LazyAdam": LazyAdamOptimizer,
+    "Adagrad": AdagradOptimizer
+}
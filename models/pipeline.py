@@ -0,0 +1,164 @@
+from utils.reformat import to_sparse_feed
+
+import numpy as np
+import os
+import tensorflow.compat.v1 as tf
+tf.disable_eager_execution()
+
+
+class Input_Pipeline(object):
+    """
+    Training input shared by the models. Batches from the negative sampler are converted and prefetched by a
+    tf.data dataset instead of being copied in through feed_dict at every step. Each input is a
+    placeholder_with_default over the dataset, so prediction and critiquing still feed the same tensors.
+    """
+    def __init__(self, text_dim, keyphrases=True, num_prefetch=2):
+        """
+        :param keyphrases: Whether batches carry keyphrases, models without explanation skip converting them.
+        :param num_prefetch: Number of batches prepared ahead of the training step.
+        """
+        self.text_dim = text_dim
+        self.keyphrases = keyphrases
+        self.batches = []
+
+        dataset = tf.data.Dataset.from_generator(self.generate,
+                                                 output_types=(tf.int32, tf.int32, tf.int32,
+                                                               tf.int64, tf.int32, tf.int64),
+                                                 output_shapes=([None], [None], [None], [None, 2], [None], [2]))
+        dataset = dataset.prefetch(num_prefetch)
+        self.iterator = tf.data.make_initializable_iterator(dataset)
+        users, items, rating, indices, values, dense_shape = self.iterator.get_next()
+
+        self.users_index = tf.placeholder_with_default(users, [None], name='user_id')
+        self.items_index = tf.placeholder_with_default(items, [None], name='item_id')
+        self.rating = tf.placeholder_with_default(rating, [None], name='rating')
+        self.keyphrase_vector = tf.SparseTensor(tf.placeholder_with_default(indices, [None, 2],
+                                                                            name='keyphrases_indices'),
+                                                tf.placeholder_with_default(values, [None],
+                                                                            name='keyphrases_values'),
+                                                tf.placeholder_with_default(dense_shape, [2],
+                                                                            name='keyphrases_shape'))
+
+    def generate(self):
+        for batch in self.batches:
+            if self.keyphrases:
+                indices, values, dense_shape = to_sparse_feed(batch[3])
+            else:
+                indices = np.zeros((0, 2), dtype=np.int64)
+                values = np.zeros(0, dtype=np.int32)
+                dense_shape = np.array([len(batch[0]), self.text_dim], dtype=np.int64)
+            yield (batch[0].astype(np.int32), batch[1].astype(np.int32), batch[2].astype(np.int32),
+                   indices, values, dense_shape)
+
+    def run_epoch(self, sess, batches, train, loss, feed_dict=None, log_every=100):
+        """
+        Run the train op over all batches of one epoch.
+        :param feed_dict: Extra inputs of the training step, e.g. dropout rate.
+        :param log_every: Fetch the loss every this many steps only, avoiding a host sync at every step.
+        :return: Fetched losses.
+        """
+        self.batches = batches
+        sess.run(self.iterator.initializer)
+
+        losses = []
+        step = 0
+        while True:
+            try:
+                if step % log_every == 0:
+                    losses.append(sess.run([train, loss], feed_dict=feed_dict)[1])
+                else:
+                    sess.run(train, feed_dict=feed_dict)
+            except tf.errors.OutOfRangeError:
+                return losses
+            step += 1
+
+
+def export_weights(sess, user_embeddings, item_embeddings, model_name, path, name):
+    """
+    Write embeddings and dense-layer weights to {path}/{name}/model.npz for models.numpy_model.NumpyModel.
+    """
+    weights = {'user_embeddings': user_embeddings, 'item_embeddings': item_embeddings}
+    weights.update({variable.op.name: variable
+                    for variable in sess.graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
+                    if not variable.op.name.startswith('embeddings')})
+    weights = sess.run(weights)
+
+    if not os.path.exists("{}/{}".format(path, name)):
+        os.makedirs("{}/{}".format(path, name))
+    np.savez("{}/{}/model.npz".format(path, name), model=model_name, **weights)
+    print("Model exported in path: {}/{}/model.npz".format(path, name))
+
+
+class Catalog_Inference(object):
+    """
+    Rating and keyphrase predictions of a batch of users against the whole catalog. The first residual layer acts on
+    concat([users, items]), so it splits into per-user and per-item projections, cached in local variables and
+    refreshed lazily after the weights change. Without residual layers the heads read the plain concatenation.
+    """
+    def __init__(self, user_embeddings, item_embeddings, users_index, residual_layers, text_dim):
+        """
+        :param residual_layers: tf.layers.Dense objects of the residual block, in order.
+        """
+        self.cached = False
+        with tf.variable_scope("inference"):
+            users = tf.nn.embedding_lookup(user_embeddings, users_index)
+            if not residual_layers:
+                shape = [tf.shape(users)[0], tf.shape(item_embeddings)[0], user_embeddings.shape[1]]
+                hi = tf.concat([tf.broadcast_to(tf.expand_dims(users, 1), shape),
+                                tf.broadcast_to(tf.expand_dims(item_embeddings, 0), shape)], axis=2)
+                self.cache_projection = tf.no_op()
+            else:
+                first_layer = residual_layers[0]
+                user_kernel, item_kernel = tf.split(first_layer.kernel, 2, axis=0)
+                user_projection = tf.Variable(tf.zeros([user_embeddings.shape[0], first_layer.units]),
+                                              trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                item_projection = tf.Variable(tf.zeros([item_embeddings.shape[0], first_layer.units]),
+                                              trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                self.cache_projection = tf.group(
+                    user_projection.assign(tf.matmul(user_embeddings, user_kernel) + first_layer.bias),
+                    item_projection.assign(tf.matmul(item_embeddings, item_kernel)))
+
+                hi = (tf.expand_dims(tf.nn.embedding_lookup(user_projection, users_index), 1)
+                      + tf.expand_dims(item_projection, 0))
+                if first_layer.activation is not None:
+                    hi = first_layer.activation(hi)
+                for layer in residual_layers[1:]:
+                    hi = layer.apply(hi)
+            self.latent = hi
+
+        with tf.variable_scope("prediction", reuse=True):
+            self.rating_prediction = tf.squeeze(tf.layers.dense(inputs=hi, units=1, activation=None,
+                                                                name='rating_prediction'), axis=2)
+            self.keyphrase_prediction = tf.layers.dense(inputs=hi, units=text_dim, activation=None,
+                                                        name='keyphrase_prediction')
+
+    def invalidate(self):
+        self.cached = False
+
+    def run(self, sess, fetches, feed_dict):
+        if not self.cached:
+            sess.run(self.cache_projection)
+            self.cached = True
+        return sess.run(fetches, feed_dict=feed_dict)
+
+    def predict(self, sess, users_index, user_index, explanation=True):
+        """
+        :return: Arrays of shape [users, items] and [users, items, text_dim]; the keyphrase head is skipped (None)
+        when explanation is False.
+        """
+        feed_dict = {users_index: user_index}
+        if not explanation:
+            return [self.run(sess, self.rating_prediction, feed_dict), None]
+        return self.run(sess, [self.rating_prediction, self.keyphrase_prediction], feed_dict)
+
+
+def critique_layers(sess):
+    """
+    :return: Kernel and bias values of the rating head, keyphrase head and looping layer, for
+    models.numpy_model.BatchCritique.
+    """
+    variables = {variable.op.name: variable
+                 for variable in sess.graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)}
+    return sess.run([(variables[name + '/kernel'], variables[name + '/bias'])
+                     for name in ['prediction/rating_prediction', 'prediction/keyphrase_prediction',
+                                  'looping/latent_reconstruction']])
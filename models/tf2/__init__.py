@@ -0,0 +1,16 @@
+from models.tf2.ncf import NCF
+from models.tf2.vncf import VNCF
+from models.tf2.e_ncf import ENCF
+from models.tf2.e_vncf import EVNCF
+from models.tf2.ce_ncf import CENCF
+from models.tf2.ce_vncf import CEVNCF
+
+
+models = {
+    "NCF": NCF,
+    "VNCF": VNCF,
+    "E-NCF": ENCF,
+    "E-VNCF": EVNCF,
+    "CE-NCF": CENCF,
+    "CE-VNCF": CEVNCF
+}
@@ -0,0 +1,345 @@
+from models.numpy_model import BatchCritique, ClosedFormCritique
+from tqdm import tqdm
+from utils.reformat import to_sparse_feed, to_sparse_matrix, to_svd
+
+import numpy as np
+import os
+import tensorflow as tf
+
+
+class Base_Model(object):
+    """
+    Eager TF2 counterpart of the graph-mode models. The forward pass is plain functions over tf.Variables and
+    training runs one tf.function compiled step per batch, optionally with XLA. Variable names follow the
+    graph-mode scopes, so export_model writes the same model.npz as the graph-mode models.
+    """
+    model_name = None
+    variational = False
+    regularized_layers = []
+
+    def __init__(self,
+                 num_users,
+                 num_items,
+                 text_dim,
+                 embed_dim,
+                 num_layers,
+                 negative_sampler,
+                 lamb=0.01,
+                 learning_rate=1e-4,
+                 optimizer=tf.compat.v1.train.AdamOptimizer,
+                 jit_compile=False,
+                 corruption=0.1,
+                 **unused):
+        """
+        :param jit_compile: Compile the training step with XLA.
+        :param corruption: Dropout rate on the embeddings of the variational models during training.
+        """
+        if not tf.executing_eagerly():
+            raise RuntimeError("The TF2 backend needs eager execution, do not import the graph-mode models first")
+
+        self.num_users = num_users
+        self.num_items = num_items
+        self.text_dim = text_dim
+        self.embed_dim = embed_dim
+        self.num_layers = num_layers
+        self.negative_sampler = negative_sampler
+        self.lamb = lamb
+        self.corruption = corruption
+        self.optimizer = optimizer(learning_rate=learning_rate)
+
+        self.user_embeddings = tf.Variable(tf.random.normal([self.num_users, self.embed_dim],
+                                                            stddev=1 / (self.embed_dim ** 0.5)), name='user_embeddings')
+        self.item_embeddings = tf.Variable(tf.random.normal([self.num_items, self.embed_dim],
+                                                            stddev=1 / (self.embed_dim ** 0.5)), name='item_embeddings')
+        self.layers = {}
+        self.get_layers()
+        self.trainable_variables = ([self.user_embeddings, self.item_embeddings]
+                                    + [variable for name in sorted(self.layers) for variable in self.layers[name]])
+
+        # Only the dense part is XLA compiled, sparse keyphrases of varying size would recompile every batch
+        self.apply_step = tf.function(self.apply_step, jit_compile=jit_compile)
+        self.train_step = tf.function(self.train_step,
+                                      input_signature=[tf.TensorSpec([None], tf.int32),
+                                                       tf.TensorSpec([None], tf.int32),
+                                                       tf.TensorSpec([None], tf.int32),
+                                                       tf.TensorSpec([None, 2], tf.int64),
+                                                       tf.TensorSpec([None], tf.int32),
+                                                       tf.TensorSpec([2], tf.int64)])
+        self.inference = tf.function(self.inference, input_signature=[tf.TensorSpec([None], tf.int32),
+                                                                      tf.TensorSpec([None], tf.int32)])
+        self.all_items_inference = tf.function(self.all_items_inference,
+                                               input_signature=[tf.TensorSpec([None], tf.int32)])
+
+    def get_layers(self):
+        hidden_dim = self.embed_dim*4 if self.variational else self.embed_dim*2
+        latent_dim = self.embed_dim*2
+        input_dim = self.embed_dim*2
+        for i in range(self.num_layers):
+            self.add_layer('residual/dense' if i == 0 else 'residual/dense_{}'.format(i), input_dim, hidden_dim)
+            input_dim = hidden_dim
+        self.add_layer('prediction/rating_prediction', latent_dim, 1)
+        self.add_layer('prediction/keyphrase_prediction', latent_dim, self.text_dim)
+
+    def add_layer(self, name, input_dim, units):
+        # Glorot uniform kernel and zero bias, the tf.layers.dense defaults
+        limit = np.sqrt(6.0 / (input_dim + units))
+        self.layers[name] = (tf.Variable(tf.random.uniform([input_dim, units], -limit, limit), name=name + '/kernel'),
+                             tf.Variable(tf.zeros([units]), name=name + '/bias'))
+
+    def dense(self, name, inputs):
+        kernel, bias = self.layers[name]
+        return tf.matmul(inputs, kernel) + bias
+
+    def residual(self, hi, first=1):
+        for i in range(first, self.num_layers):
+            hi = self.dense('residual/dense_{}'.format(i), hi)
+            if not self.variational:
+                hi = tf.nn.relu(hi)
+        return hi
+
+    def encode(self, users_index, items_index, training=False):
+        """
+        :return: Latent code fed to the prediction heads, its mean and log standard deviation (None unless
+        variational).
+        """
+        hi = tf.concat([tf.gather(self.user_embeddings, users_index),
+                        tf.gather(self.item_embeddings, items_index)], axis=1)
+        if self.variational and training:
+            hi = tf.nn.dropout(hi, rate=self.corruption)
+        hi = self.dense('residual/dense', hi)
+        if not self.variational:
+            hi = tf.nn.relu(hi)
+        return self.latent(self.residual(hi), training=training)
+
+    def latent(self, hi, training=False):
+        if not self.variational:
+            return hi, hi, None
+        mean = tf.nn.relu(hi[..., :self.embed_dim*2])
+        logstd = tf.nn.tanh(hi[..., self.embed_dim*2:])*3
+        if training:
+            return mean + tf.exp(logstd) * tf.random.normal(tf.shape(logstd)), mean, logstd
+        return mean, mean, logstd
+
+    @staticmethod
+    def kl_diagnormal_stdnormal(mu, log_std):
+        return 0.5 * tf.reduce_mean(tf.square(mu) + tf.exp(2 * log_std) - 1. - 2 * log_std)
+
+    def l2_loss(self):
+        return tf.add_n([self.lamb * tf.reduce_sum(tf.square(self.layers[name][0]))
+                         for name in self.regularized_layers])
+
+    def regularized_residual(self):
+        return ['residual/dense' if i == 0 else 'residual/dense_{}'.format(i) for i in range(self.num_layers)]
+
+    def loss(self, users_index, items_index, rating, keyphrase_vector):
+        z, mean, logstd = self.encode(users_index, items_index, training=True)
+        loss = tf.reduce_mean(tf.square(self.dense('prediction/rating_prediction', z) - rating))
+        if self.variational:
+            loss += 0.01 * self.kl_diagnormal_stdnormal(mean, logstd)
+        return loss + self.explanation_loss(z, mean, logstd, keyphrase_vector)
+
+    def explanation_loss(self, z, mean, logstd, keyphrase_vector):
+        """
+        :return: Loss terms of the keyphrase heads added to the rating loss, none without explanation.
+        """
+        return 0.
+
+    @staticmethod
+    def keyphrase_loss(keyphrase_prediction, keyphrase_vector):
+        # Weighted by the share of examples in the batch that have keyphrases
+        return (tf.reduce_mean(tf.square(keyphrase_prediction - keyphrase_vector))
+                * tf.reduce_mean(tf.reduce_max(keyphrase_vector, axis=1)))
+
+    def apply_step(self, users_index, items_index, rating, keyphrase_vector):
+        with tf.GradientTape() as tape:
+            loss = self.loss(users_index, items_index, rating, keyphrase_vector) + self.l2_loss()
+        gradients = tape.gradient(loss, self.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.trainable_variables))
+        return loss
+
+    def train_step(self, users_index, items_index, rating, indices, values, dense_shape):
+        keyphrase_vector = tf.sparse.to_dense(tf.SparseTensor(indices, values, dense_shape), validate_indices=False)
+        return self.apply_step(users_index, items_index,
+                               tf.reshape(tf.cast(rating, tf.float32), [-1, 1]),
+                               tf.cast(keyphrase_vector, tf.float32))
+
+    def generate(self, batches):
+        for batch in batches:
+            indices, values, dense_shape = to_sparse_feed(batch[3])
+            yield (batch[0].astype(np.int32), batch[1].astype(np.int32), batch[2].astype(np.int32),
+                   indices, values, dense_shape)
+
+    def train_model(self, df, user_col, item_col, rating_col, epoch=100,
+                    batches=None, init_embedding=True, log_every=100, **unused):
+
+        if init_embedding:
+            self.get_user_item_embeddings(df, user_col, item_col, rating_col)
+
+        if batches is None:
+            batches = self.negative_sampler.iterate_batches()
+
+        # Training
+        pbar = tqdm(range(epoch))
+        for i in pbar:
+            dataset = tf.data.Dataset.from_generator(lambda: self.generate(batches),
+                                                     output_signature=self.train_step.input_signature)
+            for step, batch in enumerate(dataset.prefetch(2)):
+                loss = self.train_step(*batch)
+                if step % log_every == 0:
+                    pbar.set_description("loss:{}".format(loss.numpy()))
+
+            batches = self.negative_sampler.iterate_batches()
+
+    def inference(self, users_index, items_index):
+        z, _, _ = self.encode(users_index, items_index)
+        return self.dense('prediction/rating_prediction', z), self.dense('prediction/keyphrase_prediction', z)
+
+    def all_items_latent(self, users_index):
+        """
+        :return: encode of the given users against every item, of shape [users, items, ...].
+        """
+        # The first layer acts on concat([users, items]), so it splits into per-user and per-item projections
+        kernel, bias = self.layers['residual/dense']
+        user_kernel, item_kernel = tf.split(kernel, 2, axis=0)
+        hi = (tf.expand_dims(tf.matmul(tf.gather(self.user_embeddings, users_index), user_kernel) + bias, 1)
+              + tf.expand_dims(tf.matmul(self.item_embeddings, item_kernel), 0))
+        if not self.variational:
+            hi = tf.nn.relu(hi)
+        return self.latent(self.residual(hi))
+
+    def all_items_inference(self, users_index):
+        z, _, _ = self.all_items_latent(users_index)
+        return (tf.squeeze(self.dense('prediction/rating_prediction', z), axis=2),
+                self.dense('prediction/keyphrase_prediction', z))
+
+    def predict(self, inputs, explanation=True):
+        rating, keyphrase = self.inference(tf.constant(inputs[:, 0], tf.int32), tf.constant(inputs[:, 1], tf.int32))
+        if not explanation:
+            return [rating.numpy(), None]
+        return [rating.numpy(), keyphrase.numpy()]
+
+    def predict_all_items(self, user_index, explanation=True):
+        """
+        Rating and keyphrase predictions of the given users against the whole catalog. Returns arrays of shape
+        [users, items] and [users, items, text_dim]; the keyphrase predictions are None when explanation is False.
+        """
+        rating, keyphrase = self.all_items_inference(tf.constant(np.asarray(user_index), tf.int32))
+        if not explanation:
+            return [rating.numpy(), None]
+        return [rating.numpy(), keyphrase.numpy()]
+
+    def get_user_item_embeddings(self, df, user_col, item_col, rating_col):
+        R = to_sparse_matrix(df, self.num_users, self.num_items, user_col, item_col, rating_col)
+        user_embedding, item_embedding = to_svd(R, self.embed_dim)
+        self.user_embeddings.assign(user_embedding)
+        self.item_embeddings.assign(item_embedding)
+
+    def checkpoint(self):
+        return tf.train.Checkpoint(**{'variable_{}'.format(i): variable
+                                      for i, variable in enumerate(self.trainable_variables)})
+
+    def save_model(self, path, name):
+        save_path = self.checkpoint().write("{}/{}/model.ckpt".format(path, name))
+        print("Model saved in path: %s" % save_path)
+
+    def export_model(self, path, name):
+        """
+        Write embeddings and dense-layer weights to {path}/{name}/model.npz for models.numpy_model.NumpyModel.
+        """
+        weights = {'user_embeddings': self.user_embeddings.numpy(), 'item_embeddings': self.item_embeddings.numpy()}
+        for layer, (kernel, bias) in self.layers.items():
+            weights.update({layer + '/kernel': kernel.numpy(), layer + '/bias': bias.numpy()})
+
+        if not os.path.exists("{}/{}".format(path, name)):
+            os.makedirs("{}/{}".format(path, name))
+        np.savez("{}/{}/model.npz".format(path, name), model=self.model_name, **weights)
+        print("Model exported in path: {}/{}/model.npz".format(path, name))
+
+    def load_model(self, path, name):
+        self.checkpoint().read("{}/{}/model.ckpt".format(path, name)).assert_consumed()
+        print("Model restored.")
+
+    def get_embeddings(self):
+        return [self.user_embeddings.numpy(), self.item_embeddings.numpy()]
+
+    def close(self):
+        # Eager variables are released with the model, there is no session to close
+        pass
+
+
+class Critiquing_Model(Base_Model):
+    """
+    Base of the models with a looping layer that maps (critiqued) keyphrases back to the latent space.
+    """
+    closed_form_critique = True
+
+    def __init__(self, *args, **kwargs):
+        super(Critiquing_Model, self).__init__(*args, **kwargs)
+        self.critique_inference = tf.function(self.critique_inference,
+                                              input_signature=[tf.TensorSpec([None], tf.int32)])
+        self.refine_inference = tf.function(self.refine_inference,
+                                            input_signature=[tf.TensorSpec([None], tf.int32),
+                                                             tf.TensorSpec([None], tf.int32),
+                                                             tf.TensorSpec([None, self.text_dim], tf.float32)])
+
+    def get_layers(self):
+        super(Critiquing_Model, self).get_layers()
+        self.add_layer('looping/latent_reconstruction', self.text_dim,
+                       self.embed_dim*4 if self.variational else self.embed_dim*2)
+
+    def explanation_loss(self, z, mean, logstd, keyphrase_vector):
+        keyphrase_prediction = self.dense('prediction/keyphrase_prediction', z)
+        reconstructed_latent = self.dense('looping/latent_reconstruction', keyphrase_prediction)
+        latent_loss = (tf.reduce_mean(tf.square(reconstructed_latent - self.looping_latent(mean, logstd)))
+                       * tf.reduce_mean(tf.reduce_max(keyphrase_vector, axis=1)))
+        return self.keyphrase_loss(keyphrase_prediction, keyphrase_vector) + latent_loss
+
+    def looping_latent(self, mean, logstd):
+        """
+        :return: Latent the looping layer reconstructs, without gradient.
+        """
+        if not self.variational:
+            return tf.stop_gradient(mean)
+        return tf.stop_gradient(tf.concat([mean, logstd], axis=-1))
+
+    def refine_inference(self, users_index, items_index, critiqued):
+        _, mean, logstd = self.encode(users_index, items_index)
+        reconstruction = tf.nn.relu(self.dense('looping/latent_reconstruction', critiqued))
+        modified_latent = ((self.looping_latent(mean, logstd) + reconstruction)/2.0)[:, :self.embed_dim*2]
+        return (self.dense('prediction/rating_prediction', modified_latent),
+                self.dense('prediction/keyphrase_prediction', modified_latent),
+                mean,
+                reconstruction[:, :self.embed_dim*2])
+
+    def refine_predict(self, inputs, critiqued):
+        modified_rating, modified_keyphrases, _, _ = self.refine_inference(tf.constant(inputs[:, 0], tf.int32),
+                                                                           tf.constant(inputs[:, 1], tf.int32),
+                                                                           tf.constant(critiqued, tf.float32))
+        return modified_rating.numpy(), modified_keyphrases.numpy()
+
+    def density_shifting_estimate(self, inputs, critiqued):
+        _, _, mean, modified_mean = self.refine_inference(tf.constant(inputs[:, 0], tf.int32),
+                                                          tf.constant(inputs[:, 1], tf.int32),
+                                                          tf.constant(critiqued, tf.float32))
+        return mean.numpy(), modified_mean.numpy()
+
+    def critique_inference(self, users_index):
+        z, mean, logstd = self.all_items_latent(users_index)
+        return (z, self.looping_latent(mean, logstd),
+                tf.squeeze(self.dense('prediction/rating_prediction', z), axis=2),
+                self.dense('prediction/keyphrase_prediction', z))
+
+    def critique_users(self, user_index):
+        """
+        :return: BatchCritique of the given users over all items, applying critiques in closed form to the latents
+        of one forward pass instead of running refine_predict.
+        """
+        z, latent, rating, explanation = self.critique_inference(tf.constant(np.asarray(user_index), tf.int32))
+        return BatchCritique(z.numpy(), latent.numpy(),
+                             *[tuple(variable.numpy() for variable in self.layers[name])
+                               for name in ['prediction/rating_prediction', 'prediction/keyphrase_prediction',
+                                            'looping/latent_reconstruction']],
+                             rating=rating.numpy(), explanation=explanation.numpy())
+
+    def critique(self, user_index):
+        return ClosedFormCritique(self.critique_users([user_index]))
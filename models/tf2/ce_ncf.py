@@ -0,0 +1,11 @@
+from models.tf2.base import Critiquing_Model
+
+
+class CENCF(Critiquing_Model):
+    model_name = 'CE-NCF'
+
+    def get_layers(self):
+        super(CENCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction',
+                                                                 'prediction/keyphrase_prediction',
+                                                                 'looping/latent_reconstruction']
@@ -0,0 +1,12 @@
+from models.tf2.base import Critiquing_Model
+
+
+class CEVNCF(Critiquing_Model):
+    model_name = 'CE-VNCF'
+    variational = True
+
+    def get_layers(self):
+        super(CEVNCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction',
+                                                                 'prediction/keyphrase_prediction',
+                                                                 'looping/latent_reconstruction']
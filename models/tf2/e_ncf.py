@@ -0,0 +1,13 @@
+from models.tf2.base import Base_Model
+
+
+class ENCF(Base_Model):
+    model_name = 'E-NCF'
+
+    def get_layers(self):
+        super(ENCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction',
+                                                                 'prediction/keyphrase_prediction']
+
+    def explanation_loss(self, z, mean, logstd, keyphrase_vector):
+        return self.keyphrase_loss(self.dense('prediction/keyphrase_prediction', z), keyphrase_vector)
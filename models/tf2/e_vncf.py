@@ -0,0 +1,14 @@
+from models.tf2.base import Base_Model
+
+
+class EVNCF(Base_Model):
+    model_name = 'E-VNCF'
+    variational = True
+
+    def get_layers(self):
+        super(EVNCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction',
+                                                                 'prediction/keyphrase_prediction']
+
+    def explanation_loss(self, z, mean, logstd, keyphrase_vector):
+        return self.keyphrase_loss(self.dense('prediction/keyphrase_prediction', z), keyphrase_vector)
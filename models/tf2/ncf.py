@@ -0,0 +1,9 @@
+from models.tf2.base import Base_Model
+
+
+class NCF(Base_Model):
+    model_name = 'NCF'
+
+    def get_layers(self):
+        super(NCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction']
@@ -0,0 +1,11 @@
+from models.tf2.base import Base_Model
+
+
+class VNCF(Base_Model):
+    model_name = 'VNCF'
+    variational = True
+
+    def get_layers(self):
+        super(VNCF, self).get_layers()
+        self.regularized_layers = self.regularized_residual() + ['prediction/rating_prediction',
+                                                                 'prediction/keyphrase_prediction']
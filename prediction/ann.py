@@ -0,0 +1,152 @@
+import numpy as np
+import os
+import pandas as pd
+import scipy.sparse as sparse
+import time
+
+
+class IVF_Index(object):
+    """
+    Inverted-file approximate nearest neighbour index over item vectors for inner-product retrieval.
+    Items are clustered with k-means; a query only scores the items of its num_probe best matching clusters.
+    """
+    def __init__(self, item_vectors, num_clusters=None, num_iterations=10, seed=1, chunk_size=2**16):
+        self.item_vectors = np.asarray(item_vectors, dtype=np.float32)
+        self.chunk_size = chunk_size
+        num_items = len(self.item_vectors)
+        if num_clusters is None:
+            num_clusters = int(np.ceil(np.sqrt(num_items)))
+        num_clusters = min(num_clusters, num_items)
+
+        random_state = np.random.RandomState(seed)
+        self.centroids = self.item_vectors[random_state.choice(num_items, num_clusters, replace=False)]
+        for iteration in range(num_iterations):
+            assignment = self.assign(self.item_vectors)
+            one_hot = sparse.csr_matrix((np.ones(num_items), (assignment, np.arange(num_items))),
+                                        shape=(num_clusters, num_items))
+            counts = np.asarray(one_hot.sum(axis=1)).ravel()
+            non_empty = counts > 0
+            # Empty clusters keep their previous centroid
+            self.centroids[non_empty] = (one_hot.dot(self.item_vectors)[non_empty] /
+                                         counts[non_empty, None]).astype(np.float32)
+
+        self.build_lists(self.assign(self.item_vectors))
+
+    def assign(self, vectors):
+        """
+        :return: Nearest centroid (squared L2) of each vector.
+        """
+        centroid_norms = np.sum(self.centroids**2, axis=1)
+        return np.concatenate([np.argmax(2*vectors[start:start + self.chunk_size].dot(self.centroids.T)
+                                         - centroid_norms, axis=1)
+                               for start in range(0, len(vectors), self.chunk_size)])
+
+    def build_lists(self, assignment):
+        self.order = np.argsort(assignment, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(self.centroids)))])
+
+    def search(self, queries, topn, num_probe=8, batch_size=1024):
+        """
+        :param queries: Query vectors, e.g. user embeddings, of shape [queries, dim].
+        :param num_probe: Number of clusters scored per query, trades recall for speed.
+        :return: Top n items per query by inner product and their scores, padded with -1 and -inf
+        when the probed clusters hold fewer than n items.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        num_probe = min(num_probe, len(self.centroids))
+        items = np.full((len(queries), topn), -1, dtype=np.int64)
+        scores = np.full((len(queries), topn), -np.inf, dtype=np.float32)
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            probes = np.argpartition(-batch.dot(self.centroids.T), num_probe - 1, axis=1)[:, :num_probe]
+
+            # Each probed list gets a column range in the query's row of a padded candidate matrix
+            lengths = self.offsets[probes + 1] - self.offsets[probes]
+            column_starts = (np.cumsum(lengths, axis=1) - lengths).ravel()
+            width = max(lengths.sum(axis=1).max(), topn)
+            candidates = np.full((len(batch), width), -1, dtype=np.int64)
+            candidate_scores = np.full((len(batch), width), -np.inf, dtype=np.float32)
+
+            # Score cluster by cluster so every list is one matrix product with all queries probing it
+            probe_order = np.argsort(probes, axis=None, kind='stable')
+            probe_offsets = np.concatenate([[0], np.cumsum(np.bincount(probes.ravel(),
+                                                                       minlength=len(self.centroids)))])
+            for cluster in np.flatnonzero(np.diff(probe_offsets)):
+                members = self.order[self.offsets[cluster]:self.offsets[cluster + 1]]
+                if len(members) == 0:
+                    continue
+                pairs = probe_order[probe_offsets[cluster]:probe_offsets[cluster + 1]]
+                rows = (pairs // num_probe)[:, None]
+                columns = column_starts[pairs][:, None] + np.arange(len(members))
+                candidates[rows, columns] = members
+                candidate_scores[rows, columns] = batch[rows[:, 0]].dot(self.item_vectors[members].T)
+
+            top = np.argpartition(-candidate_scores, topn - 1, axis=1)[:, :topn]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(candidate_scores, top, axis=1), axis=1),
+                                     axis=1)
+            items[start:start + len(batch)] = np.take_along_axis(candidates, top, axis=1)
+            scores[start:start + len(batch)] = np.take_along_axis(candidate_scores, top, axis=1)
+
+        return items, scores
+
+    def similar_items(self, item_index, topn, num_probe=8):
+        """
+        :return: Top n items by inner product with each given item, excluding the item itself.
+        """
+        item_index = np.asarray(item_index)
+        items, _ = self.search(self.item_vectors[item_index], topn + 1, num_probe=num_probe)
+        itself = items == item_index[:, None]
+        # Drop the item itself, or the last neighbour if the item was not retrieved
+        itself[~itself.any(axis=1), -1] = True
+        return items[~itself].reshape(len(item_index), topn)
+
+    def save(self, path, name):
+        if not os.path.exists("{}/{}".format(path, name)):
+            os.makedirs("{}/{}".format(path, name))
+        np.savez("{}/{}/ann_index.npz".format(path, name), item_vectors=self.item_vectors, centroids=self.centroids,
+                 order=self.order, offsets=self.offsets)
+        print("Index saved in path: {}/{}/ann_index.npz".format(path, name))
+
+    @classmethod
+    def load(cls, path, name):
+        arrays = np.load("{}/{}/ann_index.npz".format(path, name))
+        index = cls.__new__(cls)
+        index.item_vectors = arrays['item_vectors']
+        index.centroids = arrays['centroids']
+        index.order = arrays['order']
+        index.offsets = arrays['offsets']
+        index.chunk_size = 2**16
+        return index
+
+
+def exact_search(queries, item_vectors, topn, batch_size=256):
+    items = []
+    for start in range(0, len(queries), batch_size):
+        scores = queries[start:start + batch_size].dot(item_vectors.T)
+        top = np.argpartition(-scores, topn - 1, axis=1)[:, :topn]
+        items.append(np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1))
+    return np.concatenate(items, axis=0)
+
+
+def benchmark(index, queries, topn, num_probes):
+    """
+    Recall of the index against exact inner-product search and throughput of both, for each num_probe.
+    """
+    start_time = time.time()
+    exact = exact_search(queries, index.item_vectors, topn)
+    exact_seconds = time.time() - start_time
+
+    results = []
+    for num_probe in num_probes:
+        start_time = time.time()
+        approximate, _ = index.search(queries, topn, num_probe=num_probe)
+        seconds = time.time() - start_time
+
+        hits = [len(np.intersect1d(a, b)) for a, b in zip(approximate, exact)]
+        results.append({'num_probe': num_probe,
+                        'Recall@{0}'.format(topn): round(np.mean(hits) / topn, 4),
+                        'queries_per_second': round(len(queries) / seconds, 1),
+                        'exact_queries_per_second': round(len(queries) / exact_seconds, 1)})
+
+    return pd.DataFrame(results)
@@ -2,45 +2,64 @@ from tqdm import tqdm
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sparse
 
 
 def predict_elementwise(model, df_train, user_col, item_col, topk,
                         batch_size=1024, enable_explanation=False,
-                        keyphrase_names=None, topk_keyphrase=10):
-
+                        keyphrase_names=None, topk_keyphrase=10, max_rows=2**17, all_items=True):
+    """
+    Score all unrated items for blocks of users at once and keep the top k per user.
+    Only ratings are fetched for the catalog; keyphrases are computed for the top k items when explaining.
+    :param batch_size: Maximum number of users scored per block.
+    :param max_rows: Cap on (user, item) pairs fed to the model per block.
+    :param all_items: Score through predict_all_items when the model has it, otherwise through predict on
+    (user, item) rows.
+    :return: Top k items per user and, if enabled, their keyphrase explanations.
+    """
     predictions = []
     explanation = []
 
     num_users = model.num_users
     num_items = model.num_items
+    topk = min(topk, num_items)
+
+    rated_items = sparse.csr_matrix((np.ones(len(df_train)), (df_train[user_col].values, df_train[item_col].values)),
+                                    shape=(num_users, num_items))
+    user_batch_size = max(1, min(batch_size, max_rows // num_items))
+
+    for start in tqdm(range(0, num_users, user_batch_size)):
+        users = np.arange(start, min(start + user_batch_size, num_users))
+        if all_items and hasattr(model, 'predict_all_items'):
+            rating, _ = model.predict_all_items(users, explanation=False)
+        else:
+            inputs = np.stack([np.repeat(users, num_items), np.tile(np.arange(num_items), len(users))], axis=1)
+            rating, _ = model.predict(inputs, explanation=False)
 
-    for i in tqdm(range(num_users)):
-        input_batch = []
-        output_batch = []
-        rated_items = df_train[df_train[user_col] == i][item_col].values
-        for j in range(num_items):
-            if j in rated_items:
-                continue
-            input_batch.append([i, j])
-            if (j + 1) % batch_size == 0 or (j + 1) == num_items:
-                inputs = np.array(input_batch)
-                output_batch.append(np.concatenate([inputs] + model.predict(inputs), axis=1))
-                input_batch = []
-
-        prediction = np.concatenate(output_batch, axis=0)
-        prediction = prediction[prediction[:, 2].argsort()[::-1][:topk]]
-        candidates = prediction[:, 1].astype(int)
+        scores = rating.reshape(len(users), num_items)
+        scores[rated_items[users].nonzero()] = -np.inf
+
+        candidates = np.argpartition(-scores, topk - 1, axis=1)[:, :topk]
+        order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
         predictions.append(candidates)
 
         if enable_explanation:
-            for j in range(topk):
-                candidate_keyphrase_indicies = np.argsort(prediction[j, 3:])[::-1][:topk_keyphrase]
-                candidate_keyphrases = keyphrase_names[candidate_keyphrase_indicies]
-                explanation.append({user_col: i, item_col: candidates[j],
-                                    'ExplanIndex': candidate_keyphrase_indicies,
-                                    'Explanation': candidate_keyphrases})
-
-    return np.array(predictions), pd.DataFrame(explanation)
+            # Keyphrases are only scored for the final top k items of each user
+            inputs = np.stack([np.repeat(users, topk), candidates.ravel()], axis=1)
+            _, keyphrase = model.predict(inputs)
+            candidate_keyphrase_indicies = np.argsort(keyphrase, axis=1)[:, ::-1][:, :topk_keyphrase]
+            explanation.append(pd.DataFrame({user_col: inputs[:, 0],
+                                             item_col: inputs[:, 1],
+                                             'ExplanIndex': list(candidate_keyphrase_indicies),
+                                             'Explanation': list(keyphrase_names[candidate_keyphrase_indicies])}))
+
+    if explanation:
+        explanation = pd.concat(explanation, ignore_index=True)
+    else:
+        explanation = pd.DataFrame(explanation)
+
+    return np.concatenate(predictions, axis=0), explanation
 
 
 def predict_explanation(model, df_valid, user_col, item_col, topk_keyphrase=10):
@@ -0,0 +1,67 @@
+from tqdm import tqdm
+from utils.reformat import to_sparse_matrix, to_svd
+
+import numpy as np
+import scipy.sparse as sparse
+
+
+def svd_factors(df_train, num_users, num_items, user_col, item_col, rating_col, rank):
+    R = to_sparse_matrix(df_train, num_users, num_items, user_col, item_col, rating_col)
+    return to_svd(R, rank, standard=False)
+
+
+def embedding_factors(model):
+    return model.get_embeddings()
+
+
+def retrieve_candidates(user_factors, item_factors, user_index, num_candidates, rated_items=None):
+    """
+    :param rated_items: CSR matrix of items to exclude per user.
+    :return: Top num_candidates items per user by factor dot product (unordered) and their retrieval scores.
+    """
+    scores = user_factors[user_index].dot(item_factors.T)
+    if rated_items is not None:
+        scores[rated_items[user_index].nonzero()] = -np.inf
+
+    candidates = np.argpartition(-scores, num_candidates - 1, axis=1)[:, :num_candidates]
+    return candidates, np.take_along_axis(scores, candidates, axis=1)
+
+
+def predict_two_stage(model, df_train, user_col, item_col, topk, user_factors, item_factors,
+                      num_candidates=200, batch_size=1024, max_rows=2**17):
+    """
+    Retrieve the top num_candidates unrated items of each user with a dot product over the given factors,
+    then re-rank only those candidates with the model.
+    :param user_factors: User vectors, e.g. from svd_factors or embedding_factors.
+    :param item_factors: Item vectors in the same space as user_factors.
+    :param num_candidates: Number of candidates re-ranked per user, trades recall for scoring cost.
+    :return: Top k items per user, same layout as predict_elementwise.
+    """
+    predictions = []
+
+    num_users = model.num_users
+    num_items = model.num_items
+    num_candidates = min(num_candidates, num_items)
+    topk = min(topk, num_candidates)
+
+    rated_items = sparse.csr_matrix((np.ones(len(df_train)), (df_train[user_col].values, df_train[item_col].values)),
+                                    shape=(num_users, num_items))
+    user_batch_size = max(1, min(batch_size, max_rows // num_candidates))
+
+    for start in tqdm(range(0, num_users, user_batch_size)):
+        users = np.arange(start, min(start + user_batch_size, num_users))
+        candidates, retrieval_scores = retrieve_candidates(user_factors, item_factors, users, num_candidates,
+                                                           rated_items=rated_items)
+
+        inputs = np.stack([np.repeat(users, num_candidates), candidates.ravel()], axis=1)
+        rating, _ = model.predict(inputs, explanation=False)
+
+        scores = rating.reshape(len(users), num_candidates)
+        # Users with fewer unrated items than candidates keep rated ones at the bottom
+        scores[np.isneginf(retrieval_scores)] = -np.inf
+
+        top = np.argpartition(-scores, topk - 1, axis=1)[:, :topk]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        predictions.append(np.take_along_axis(candidates, np.take_along_axis(top, order, axis=1), axis=1))
+
+    return np.concatenate(predictions, axis=0)
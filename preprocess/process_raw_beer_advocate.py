@@ -1,14 +1,38 @@
+from collections import deque
 from tqdm import tqdm
 
+import argparse
 import gzip
+import multiprocessing
+import numpy as np
 import pandas as pd
-import time
 
 
-def parse(filename):
-    f = gzip.open(filename, 'r')
+COLUMNS = ['beer/name', 'beer/ABV', 'beer/style', 'review/overall', 'review/text', 'review/timeUnix',
+           'user/profileName']
+
+
+def read_chunks(filename, chunk_bytes):
+    """
+    Yield lists of raw lines of roughly chunk_bytes, each ending on a record boundary.
+    """
+    with gzip.open(filename, 'rb') as f:
+        while True:
+            lines = f.readlines(chunk_bytes)
+            if not lines:
+                break
+            # Finish the last record so that no record spans two chunks
+            while lines[-1].find(b':') != -1:
+                line = f.readline()
+                if not line:
+                    break
+                lines.append(line)
+            yield lines
+
+
+def parse(lines):
     entry = {}
-    for l in f:
+    for l in lines:
         l = l.decode("utf-8").strip()
         colonPos = l.find(':')
         if colonPos == -1:
@@ -20,39 +44,69 @@ def parse(filename):
         entry[eName] = rest
     yield entry
 
-data_dict = []
-
-for e in tqdm(parse("data/beer/Beeradvocate.txt.gz")):
-    try:
-        e['review/appearance'] = float(e['review/appearance'])
-        e['review/taste'] = float(e['review/taste'])
-        e['review/overall'] = float(e['review/overall'])
-        e['review/palate'] = float(e['review/palate'])
-        e['review/aroma'] = float(e['review/aroma'])
-        e['review/timeUnix'] = int(e['review/time'])
-        e.pop('review/time', None)
+
+def process_chunk(lines):
+    columns = {name: [] for name in COLUMNS}
+    for e in parse(lines):
+        try:
+            # Scores that are dropped from the output still have to be valid for the review to be kept
+            for score in ['review/appearance', 'review/taste', 'review/palate', 'review/aroma']:
+                float(e[score])
+            overall = float(e['review/overall'])
+            time_unix = int(e['review/time'])
+            # Records without name, style or text are kept with NaN, only the profile name is required
+            values = [e.get('beer/name', np.nan), e.get('beer/style', np.nan), e.get('review/text', np.nan),
+                      e['review/profileName']]
+        except Exception as q:
+            continue
         try:
-            e['beer/ABV'] = float(e['beer/ABV'])
+            abv = float(e['beer/ABV'])
         except Exception as q:
-            e.pop('beer/ABV', None)
-        e['user/profileName'] = e['review/profileName']
-        e.pop('review/profileName', None)
-        timeStruct = time.gmtime(e['review/timeUnix'])
-        e['review/timeStruct'] = dict(zip(["year", "mon", "mday", "hour",
-                                           "min", "sec", "wday", "yday",
-                                           "isdst"], list(timeStruct)))
-        data_dict.append(e)
-    except Exception as q:
-        pass
+            abv = np.nan
+
+        for name, value in zip(['beer/name', 'beer/style', 'review/text', 'user/profileName'], values):
+            columns[name].append(value)
+        columns['beer/ABV'].append(abv)
+        columns['review/overall'].append(overall)
+        columns['review/timeUnix'].append(time_unix)
+
+    df = pd.DataFrame(columns, columns=COLUMNS)
+    return df.astype({'beer/ABV': np.float64, 'review/overall': np.float64, 'review/timeUnix': np.int64})
+
+
+def main(args):
+    pending = deque()
+    num_rows = 0
+
+    def write(df):
+        df.index = pd.RangeIndex(num_rows, num_rows + len(df))
+        df.to_csv(args.data_dir + args.output, mode='w' if num_rows == 0 else 'a', header=num_rows == 0)
+        return num_rows + len(df)
+
+    # Workers are terminated on leaving the block, also when a chunk fails
+    with multiprocessing.Pool(args.num_workers) as pool:
+        # Parse chunks in worker processes while keeping a bounded number in flight, so memory stays flat
+        for lines in tqdm(read_chunks(args.data_dir + args.input, args.chunk_bytes)):
+            pending.append(pool.apply_async(process_chunk, (lines,)))
+            if len(pending) >= 2 * args.num_workers:
+                num_rows = write(pending.popleft().get())
+
+        while pending:
+            num_rows = write(pending.popleft().get())
+
+    print("{} reviews written to {}".format(num_rows, args.data_dir + args.output))
 
-df = pd.DataFrame(data_dict)
 
-columnToDrop = ['review/appearance','review/aroma','review/palate',
-                'review/taste','review/timeStruct', 'beer/beerId',
-                'beer/brewerId']
+if __name__ == "__main__":
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description="Process Raw Beer Advocate Reviews")
 
-df = df.drop(columnToDrop, axis=1)
+    parser.add_argument('--chunk_bytes', dest='chunk_bytes', type=int, default=2**24)
+    parser.add_argument('--data_dir', dest='data_dir', default="data/beer/")
+    parser.add_argument('--input', dest='input', default="Beeradvocate.txt.gz")
+    parser.add_argument('--num_workers', dest='num_workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--output', dest='output', default="RefinedRawData.csv")
 
-print(df.dtypes)
+    args = parser.parse_args()
 
-df.to_csv('data/beer/RefinedRawData.csv')
+    main(args)
@@ -1,10 +1,9 @@
 from experiment.convergence import converge, explanation_converge
 from utils.argcheck import check_int_positive
-from utils.io import find_best_hyperparameters, load_yaml
+from utils.io import find_best_hyperparameters, load_dataset_counts, load_split, load_yaml
 from utils.plot import show_training_progress
 
 import argparse
-import ast
 import pandas as pd
 
 
@@ -16,14 +15,15 @@ def main(args):
     else:
         df = find_best_hyperparameters(table_path + args.tuning_result_path, 'NDCG')
 
-    num_users = pd.read_csv(args.data_dir + args.dataset_name + '/' + args.user_col + '.csv')[args.user_col].nunique()
-    num_items = pd.read_csv(args.data_dir + args.dataset_name + '/' + args.item_col + '.csv')[args.item_col].nunique()
+    data_dir = args.data_dir + args.dataset_name + '/'
+    num_users, num_items = load_dataset_counts(data_dir, args.user_col, args.item_col)
 
-    df_train = pd.read_csv(args.data_dir + args.dataset_name + '/' + args.train_set)
+    df_train = load_split(data_dir, args.train_set, args.user_col, args.item_col, args.rating_col,
+                          args.keyphrase_vector_col)
     df_train = df_train[df_train[args.rating_col] == 1]
-    df_train[args.keyphrase_vector_col] = df_train[args.keyphrase_vector_col].apply(ast.literal_eval)
 
-    df_test = pd.read_csv(args.data_dir + args.dataset_name + '/' + args.test_set)
+    df_test = load_split(data_dir, args.test_set, args.user_col, args.item_col, args.rating_col,
+                         args.keyphrase_vector_col)
 
     keyphrase_names = pd.read_csv(args.data_dir + args.dataset_name + '/' + args.keyphrase_set)[args.keyphrase_col].values
 
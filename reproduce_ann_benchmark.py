@@ -0,0 +1,37 @@
+from models.numpy_model import NumpyModel
+from prediction.ann import IVF_Index, benchmark
+from utils.io import load_yaml, save_dataframe_csv
+
+import argparse
+
+
+def main(args):
+    pretrained_path = load_yaml('config/global.yml', key='path')['pretrained']
+    table_path = load_yaml('config/global.yml', key='path')['tables']
+
+    model = NumpyModel(pretrained_path + args.model_saved_path, args.model)
+
+    index = IVF_Index(model.item_embeddings, num_clusters=args.num_clusters)
+    index.save(pretrained_path + args.model_saved_path, args.model)
+
+    df = benchmark(index, model.user_embeddings, args.topn, args.num_probes)
+    df.insert(0, 'model', args.model)
+    print(df)
+
+    save_dataframe_csv(df, table_path, args.save_path)
+
+
+if __name__ == "__main__":
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description="Approximate Nearest Neighbour Index Recall vs Throughput")
+
+    parser.add_argument('--model', dest='model', default="CE-VNCF")
+    parser.add_argument('--model_saved_path', dest='model_saved_path', default="CDsVinyl")
+    parser.add_argument('--num_clusters', dest='num_clusters', type=int, default=None)
+    parser.add_argument('--num_probes', dest='num_probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--save_path', dest='save_path', default="CD_ann_benchmark.csv")
+    parser.add_argument('--topn', dest='topn', type=int, default=50)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -1,24 +1,24 @@
 from experiment.critiquing import critiquing
 from utils.argcheck import check_int_positive
+from utils.io import load_dataset_counts, load_split
 
-import ast
 import argparse
 import pandas as pd
 
 
 def main(args):
 
-    num_users = pd.read_csv(args.data_dir + args.user_col + '.csv')[args.user_col].nunique()
-    num_items = pd.read_csv(args.data_dir + args.item_col + '.csv')[args.item_col].nunique()
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
 
-    df_train = pd.read_csv(args.data_dir + args.train_set)
+    df_train = load_split(args.data_dir, args.train_set, args.user_col, args.item_col, args.rating_col,
+                          args.keyphrase_vector_col)
     df_train = df_train[df_train[args.rating_col] == 1]
-    df_train[args.keyphrase_vector_col] = df_train[args.keyphrase_vector_col].apply(ast.literal_eval)
 
     keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
 
     params = dict()
     params['model_saved_path'] = args.model_saved_path
+    params['export'] = args.export
 
     critiquing(num_users,
                num_items,
@@ -39,6 +39,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Reproduce Critiquing Performance")
 
     parser.add_argument('--data_dir', dest='data_dir', default="data/CDsVinyl/")
+    parser.add_argument('--export', dest='export', action='store_true',
+                        help='Export the weights to model.npz for NumpyModel inference')
     parser.add_argument('--item_col', dest='item_col', default="ItemIndex")
     parser.add_argument('--keyphrase', dest='keyphrase_set', default="KeyPhrases.csv")
     parser.add_argument('--keyphrase_col', dest='keyphrase_col', default="Phrases")
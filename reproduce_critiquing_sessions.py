@@ -0,0 +1,70 @@
+from models.numpy_model import NumpyModel
+from utils.io import load_yaml, save_dataframe_csv
+from utils.session import Session_Store
+
+import argparse
+import numpy as np
+import pandas as pd
+import time
+
+
+def main(args):
+    pretrained_path = load_yaml('config/global.yml', key='path')['pretrained']
+    table_path = load_yaml('config/global.yml', key='path')['tables']
+
+    model = NumpyModel(pretrained_path + args.model_saved_path, args.model)
+    store = Session_Store(model, model.num_items, max_sessions=args.max_sessions)
+
+    results = []
+    for user in np.random.choice(model.num_users, args.num_users_sampled, replace=False):
+        start = time.time()
+        session = store.get(user)
+        latency = time.time() - start
+        # Items whose top keyphrases contain a critiqued keyphrase count as affected
+        top_keyphrases = np.argpartition(-session.explanation, args.topk_keyphrase - 1, axis=1)[:, :args.topk_keyphrase]
+        critiqued = np.zeros(model.text_dim, dtype=bool)
+
+        for step in range(args.num_steps + 1):
+            recommended = store.recommend(user, args.topk)
+            results.append({'model': args.model,
+                            'UserIndex': user,
+                            'step': step,
+                            'latency': latency,
+                            'affected@{0}'.format(args.topk): critiqued[top_keyphrases[recommended]].any(axis=1).mean()})
+            if step == args.num_steps:
+                break
+
+            # Critique the keyphrase most predicted for the current recommendations
+            scores = session.explanation[recommended].sum(axis=0)
+            scores[critiqued] = -np.inf
+            keyphrase = np.argmax(scores)
+            critiqued[keyphrase] = True
+
+            start = time.time()
+            store.critique(user, keyphrase)
+            latency = time.time() - start
+
+        store.close(user)
+
+    df = pd.DataFrame(results)
+    print(df.groupby('step')[['latency', 'affected@{0}'.format(args.topk)]].mean())
+
+    save_dataframe_csv(df, table_path, args.save_path)
+
+
+if __name__ == "__main__":
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description="Multi-Step Critiquing Sessions")
+
+    parser.add_argument('--max_sessions', dest='max_sessions', type=int, default=1000)
+    parser.add_argument('--model', dest='model', default="CE-VNCF", choices=['CE-NCF', 'CE-VNCF'])
+    parser.add_argument('--model_saved_path', dest='model_saved_path', default="CDsVinyl")
+    parser.add_argument('--num_steps', dest='num_steps', type=int, default=5)
+    parser.add_argument('--num_users_sampled', dest='num_users_sampled', type=int, default=100)
+    parser.add_argument('--save_path', dest='save_path', default="CD_critiquing_sessions.csv")
+    parser.add_argument('--topk', dest='topk', type=int, default=10)
+    parser.add_argument('--topk_keyphrase', dest='topk_keyphrase', type=int, default=10)
+
+    args = parser.parse_args()
+
+    main(args)
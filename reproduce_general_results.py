@@ -1,20 +1,20 @@
 from experiment.general import general
+from utils.io import load_dataset_counts, load_split
 
 import argparse
-import ast
 import pandas as pd
 
 
 def main(args):
 
-    num_users = pd.read_csv(args.data_dir + args.user_col + '.csv')[args.user_col].nunique()
-    num_items = pd.read_csv(args.data_dir + args.item_col + '.csv')[args.item_col].nunique()
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
 
-    df_train = pd.read_csv(args.data_dir + args.train_set)
+    df_train = load_split(args.data_dir, args.train_set, args.user_col, args.item_col, args.rating_col,
+                          args.keyphrase_vector_col)
     df_train = df_train[df_train[args.rating_col] == 1]
-    df_train[args.keyphrase_vector_col] = df_train[args.keyphrase_vector_col].apply(ast.literal_eval)
 
-    df_test = pd.read_csv(args.data_dir + args.test_set)
+    df_test = load_split(args.data_dir, args.test_set, args.user_col, args.item_col, args.rating_col,
+                         args.keyphrase_vector_col)
 
     keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
 
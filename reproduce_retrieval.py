@@ -0,0 +1,57 @@
+from experiment.retrieval import retrieval
+from utils.io import load_dataset_counts, load_split
+
+import argparse
+import pandas as pd
+
+
+def main(args):
+
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
+
+    df_train = load_split(args.data_dir, args.train_set, args.user_col, args.item_col, args.rating_col,
+                          args.keyphrase_vector_col)
+    df_train = df_train[df_train[args.rating_col] == 1]
+
+    df_test = load_split(args.data_dir, args.test_set, args.user_col, args.item_col, args.rating_col,
+                         args.keyphrase_vector_col)
+
+    keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
+
+    params = dict()
+    params['tuning_result_path'] = args.tuning_result_path
+    params['num_candidates'] = args.num_candidates
+
+    retrieval(num_users,
+              num_items,
+              args.user_col,
+              args.item_col,
+              args.rating_col,
+              args.keyphrase_vector_col,
+              df_train,
+              df_test,
+              keyphrase_names,
+              params,
+              save_path=args.save_path)
+
+
+if __name__ == "__main__":
+    # Commandline arguments
+    parser = argparse.ArgumentParser(description="Two-Stage Retrieval Recall vs Latency")
+
+    parser.add_argument('--data_dir', dest='data_dir', default="data/CDsVinyl/")
+    parser.add_argument('--item_col', dest='item_col', default="ItemIndex")
+    parser.add_argument('--keyphrase', dest='keyphrase_set', default="KeyPhrases.csv")
+    parser.add_argument('--keyphrase_col', dest='keyphrase_col', default="Phrases")
+    parser.add_argument('--keyphrase_vector_col', dest='keyphrase_vector_col', default="keyVector")
+    parser.add_argument('--num_candidates', dest='num_candidates', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--rating_col', dest='rating_col', default="Binary")
+    parser.add_argument('--save_path', dest='save_path', default="CD_retrieval.csv")
+    parser.add_argument('--test', dest='test_set', default="Test.csv")
+    parser.add_argument('--train', dest='train_set', default="Train.csv")
+    parser.add_argument('--tuning_result_path', dest='tuning_result_path', default="CDsVinyl")
+    parser.add_argument('--user_col', dest='user_col', default="UserIndex")
+
+    args = parser.parse_args()
+
+    main(args)
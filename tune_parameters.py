@@ -1,27 +1,53 @@
 from experiment.tuning import explanation_parameter_tuning, hyper_parameter_tuning
-from utils.io import load_yaml
-from utils.modelnames import models
+from utils.io import load_dataset_counts, load_split, load_split_matrix, load_yaml, split_cache_path
+from utils.store import build_shared_store, shared_store_is_fresh, Shared_Store
 
 import argparse
-import ast
 import pandas as pd
 
 
+def load_train(args, num_keyphrases):
+    """
+    :return: Positive training interactions and their keyphrase matrix.
+    """
+    df_train, keyphrases = load_split_matrix(args.data_dir, args.train_set, args.user_col, args.item_col,
+                                             args.rating_col, args.keyphrase_vector_col, num_keyphrases)
+    positive = (df_train[args.rating_col] == 1).values
+    return df_train[positive], keyphrases[positive]
+
+
 def main(args):
     params = load_yaml(args.parameters)
 
+    if args.backend == 'tf2':
+        # Imported on demand, the graph-mode models disable eager execution when imported
+        from models.tf2 import models
+    else:
+        from utils.modelnames import models
+
     params['models'] = {params['models']: models[params['models']]}
 
-    num_users = pd.read_csv(args.data_dir + args.user_col + '.csv')[args.user_col].nunique()
-    num_items = pd.read_csv(args.data_dir + args.item_col + '.csv')[args.item_col].nunique()
+    num_users, num_items = load_dataset_counts(args.data_dir, args.user_col, args.item_col)
 
-    df_train = pd.read_csv(args.data_dir + args.train_set)
-    df_train = df_train[df_train[args.rating_col] == 1]
-    df_train[args.keyphrase_vector_col] = df_train[args.keyphrase_vector_col].apply(ast.literal_eval)
+    keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
 
-    df_valid = pd.read_csv(args.data_dir + args.valid_set)
+    store = None
+    keyphrases = None
+    if args.shared_store:
+        # Concurrent tuning jobs memory-map one copy of the training interactions and sampler matrices
+        store_path = split_cache_path(args.data_dir, args.train_set) + 'shared/'
+        source = args.data_dir + args.train_set
+        if not shared_store_is_fresh(store_path, source):
+            df_train, keyphrases = load_train(args, len(keyphrase_names))
+            build_shared_store(store_path, df_train, args.user_col, args.item_col, args.keyphrase_vector_col,
+                               num_items, len(keyphrase_names), source=source, keyphrase_matrix=keyphrases)
+        store = Shared_Store(store_path)
+        df_train = store.frame(args.rating_col)
+    else:
+        df_train, keyphrases = load_train(args, len(keyphrase_names))
 
-    keyphrase_names = pd.read_csv(args.data_dir + args.keyphrase_set)[args.keyphrase_col].values
+    df_valid = load_split(args.data_dir, args.valid_set, args.user_col, args.item_col, args.rating_col,
+                          args.keyphrase_vector_col)
 
     if args.explanation:
         explanation_parameter_tuning(num_users,
@@ -34,7 +60,10 @@ def main(args):
                                      df_valid,
                                      keyphrase_names,
                                      params,
-                                     save_path=args.save_path)
+                                     save_path=args.save_path,
+                                     store=store,
+                                     keyphrase_matrix=keyphrases,
+                                     jit_compile=args.jit_compile)
     else:
         hyper_parameter_tuning(num_users,
                                num_items,
@@ -46,22 +75,28 @@ def main(args):
                                df_valid,
                                keyphrase_names,
                                params,
-                               save_path=args.save_path)
+                               save_path=args.save_path,
+                               store=store,
+                               keyphrase_matrix=keyphrases,
+                               jit_compile=args.jit_compile)
 
 
 if __name__ == "__main__":
     # Commandline arguments
     parser = argparse.ArgumentParser(description="ParameterTuning")
 
+    parser.add_argument('--backend', dest='backend', default="tf1", choices=['tf1', 'tf2'])
     parser.add_argument('--data_dir', dest='data_dir', default="data/beer/")
     parser.add_argument('--explanation', dest='explanation', action="store_true")
     parser.add_argument('--item_col', dest='item_col', default="ItemIndex")
+    parser.add_argument('--jit_compile', dest='jit_compile', action="store_true")
     parser.add_argument('--keyphrase', dest='keyphrase_set', default="KeyPhrases.csv")
     parser.add_argument('--keyphrase_col', dest='keyphrase_col', default="Phrases")
     parser.add_argument('--keyphrase_vector_col', dest='keyphrase_vector_col', default="keyVector")
     parser.add_argument('--parameters', dest='parameters', default='config/default.yml')
     parser.add_argument('--rating_col', dest='rating_col', default="Binary")
     parser.add_argument('--save_path', dest='save_path', default="ncf_tuning.csv")
+    parser.add_argument('--shared_store', dest='shared_store', action="store_true")
     parser.add_argument('--train', dest='train_set', default="Train.csv")
     parser.add_argument('--user_col', dest='user_col', default="UserIndex")
     parser.add_argument('--valid', dest='valid_set', default="Valid.csv")
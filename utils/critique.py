@@ -3,37 +3,158 @@ from sklearn.decomposition import PCA
 import numpy as np
 
 
-def critique_keyphrase(model, user_index, num_items, topk_keyphrase=10):
-    # Get the given user and all item pairs as input to critiquing models
-    inputs = np.array([[user_index, item_index] for item_index in range(num_items)])
-    # Get rating and explanation prediction for the given user and all item pairs
-    rating, explanation = model.predict(inputs)
-
-    # For the given user, get top k keyphrases for each item
-    explanation_rank_list = np.argsort(-explanation, axis=1)[:, :topk_keyphrase]
-
-    # Random critique one keyphrase among existing predicted keyphrases
-    unique_keyphrase = np.unique(explanation_rank_list)
-    keyphrase_index = int(np.random.choice(unique_keyphrase, 1)[0])
+def predict_user(model, user_index, inputs):
+    # Models with cached first-layer projections score the whole catalog without re-running the first layer
+    if hasattr(model, 'predict_all_items'):
+        rating, explanation = model.predict_all_items([user_index])
+        return rating[0], explanation[0]
+    return model.predict(inputs)
+
+
+def user_item_grid(user_index, num_items):
+    return np.stack(np.broadcast_arrays(user_index[:, None], np.arange(num_items)[None, :]), axis=-1).reshape(-1, 2)
+
+
+def predict_users(model, user_index, num_items):
+    inputs = user_item_grid(user_index, num_items)
+    if hasattr(model, 'predict_all_items'):
+        rating, explanation = model.predict_all_items(user_index)
+    else:
+        rating, explanation = model.predict(inputs)
+    return inputs, rating.reshape(len(user_index), num_items), explanation.reshape(len(user_index), num_items, -1)
+
+
+class Keyphrase_Index(object):
+    """
+    Inverted keyphrase -> item index over the top k predicted keyphrases of every item, for each indexed user.
+    Users are addressed by their position in the explanation tensor the index was built from.
+    """
+    def __init__(self, explanation, topk_keyphrase=10):
+        """
+        :param explanation: Keyphrase predictions of shape [users, items, keyphrases].
+        """
+        num_users, num_items, self.num_keyphrases = explanation.shape
+        topk_keyphrase = min(topk_keyphrase, self.num_keyphrases)
+        explanation_rank_list = np.argpartition(-explanation, topk_keyphrase - 1, axis=2)[:, :, :topk_keyphrase]
+
+        keys = (np.arange(num_users)[:, None, None]*self.num_keyphrases + explanation_rank_list).ravel()
+        order = np.argsort(keys, kind='stable')
+        self.items = np.broadcast_to(np.arange(num_items)[None, :, None], explanation_rank_list.shape).ravel()[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=num_users*self.num_keyphrases))])
+
+    def keyphrase_counts(self):
+        return np.diff(self.indptr).reshape(-1, self.num_keyphrases)
+
+    def choices(self, user):
+        """
+        :return: Keyphrases predicted for at least one item of the user, i.e. the available critiques.
+        """
+        row = user*self.num_keyphrases
+        return np.flatnonzero(np.diff(self.indptr[row:row + self.num_keyphrases + 1]))
+
+    def affected_items(self, user, keyphrase):
+        row = user*self.num_keyphrases + keyphrase
+        return self.items[self.indptr[row]:self.indptr[row + 1]]
+
+    def affected_mask(self, users, keyphrases, num_items):
+        rows = np.asarray(users)*self.num_keyphrases + np.asarray(keyphrases)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        mask = np.zeros((len(rows), num_items), dtype=bool)
+        mask[np.repeat(np.arange(len(rows)), lengths), self.items[np.repeat(starts, lengths) + offsets]] = True
+        return mask
+
+
+def critique_keyphrases(model, user_index, num_items, keyphrase_index=None, topk_keyphrase=10, batch_size=2**17,
+                        num_ranked=None):
+    """
+    Batched critique_keyphrase over many users, scoring (user, item) rows in large chunks.
+    Repeated users are predicted and indexed once and share one Keyphrase_Index.
+    :param user_index: Users to critique for, may contain repeats.
+    :param keyphrase_index: Keyphrase critiqued by each user, randomly chosen among the keyphrases
+    predicted for the user's items if not given.
+    :param batch_size: Maximum number of (user, item) rows per predict and refine_predict call. Models with
+    closed_form_critique refine through critique_users instead of refine_predict.
+    :param num_ranked: Length of the returned rankings, all items if not given.
+    :return: Item rankings before and after critiquing of shape [users, num_ranked] and the affected item mask
+    of shape [users, items].
+    """
+    user_index = np.asarray(user_index)
+    if num_ranked is None:
+        num_ranked = num_items
+    users_per_batch = max(1, batch_size // num_items)
+
+    rankings = np.empty((len(user_index), num_ranked), dtype=np.int64)
+    modified_rankings = np.empty((len(user_index), num_ranked), dtype=np.int64)
+    affected_items = np.empty((len(user_index), num_items), dtype=bool)
+
+    # Group repeated users so each one is predicted once
+    order = np.argsort(user_index, kind='stable')
+    sorted_users = user_index[order]
+    first = np.concatenate([[True], sorted_users[1:] != sorted_users[:-1]])
+    unique_users = sorted_users[first]
+    boundaries = np.append(np.flatnonzero(first), len(sorted_users))
+
+    for start in range(0, len(unique_users), users_per_batch):
+        users = unique_users[start:start + users_per_batch]
+        occurrences = order[boundaries[start]:boundaries[start + len(users)]]
+        positions = np.searchsorted(users, user_index[occurrences])
+
+        # Get rating and explanation prediction for the given users and all item pairs
+        engine = None
+        if getattr(model, 'closed_form_critique', False):
+            engine = model.critique_users(users)
+            rating, explanation = engine.rating, engine.explanation
+        else:
+            _, rating, explanation = predict_users(model, users, num_items)
+        keyphrase_item_index = Keyphrase_Index(explanation, topk_keyphrase)
+
+        # Random critique one keyphrase among existing predicted keyphrases per user
+        if keyphrase_index is None:
+            candidates = keyphrase_item_index.keyphrase_counts()[positions] > 0
+            keyphrases = np.argmax(candidates * (np.random.random(candidates.shape) + 1), axis=1)
+        else:
+            keyphrases = np.asarray(keyphrase_index)[occurrences]
+
+        # Get all affected items
+        affected_items[occurrences] = keyphrase_item_index.affected_mask(positions, keyphrases, num_items)
+        rankings[occurrences] = np.argsort(rating, axis=1)[:, ::-1][positions, :num_ranked]
+
+        for refine_start in range(0, len(occurrences), users_per_batch):
+            batch = slice(refine_start, refine_start + users_per_batch)
+            batch_positions = positions[batch]
+            num_batch_users = len(batch_positions)
+
+            if engine is not None:
+                # Closed-form update of the cached latents, no second pass through the model
+                modified_rating = engine.refine(batch_positions, keyphrases[batch])
+            else:
+                # Zero out the critiqued keyphrase in all items
+                critiqued = explanation[batch_positions]
+                critiqued[np.arange(num_batch_users), :, keyphrases[batch]] = np.min(critiqued, axis=2)
+
+                modified_rating, _ = model.refine_predict(user_item_grid(users[batch_positions], num_items),
+                                                          critiqued.reshape(-1, critiqued.shape[2]))
+            modified_rankings[occurrences[batch]] = np.argsort(modified_rating.reshape(num_batch_users, num_items),
+                                                               axis=1)[:, ::-1][:, :num_ranked]
+
+    return rankings, modified_rankings, affected_items
 
-    # Get all affected items
-    affected_items = np.where(explanation_rank_list == keyphrase_index)[0]
 
-    # Zero out the critiqued keyphrase in all items
-    explanation[:, keyphrase_index] = np.min(explanation, axis=1)
-
-    modified_rating, modified_explanation = model.refine_predict(inputs, explanation)
+def critique_keyphrase(model, user_index, num_items, topk_keyphrase=10):
+    rating, modified_rating, affected_items = critique_keyphrases(model, [user_index], num_items,
+                                                                  topk_keyphrase=topk_keyphrase)
 
-    return np.argsort(rating.flatten())[::-1], np.argsort(modified_rating.flatten())[::-1], affected_items
+    return rating[0], modified_rating[0], np.where(affected_items[0])[0]
 
 
 def latent_density(model, user_index, num_items, topk_keyphrase=10):
     inputs = np.array([[user_index, item_index] for item_index in range(num_items)])
-    rating, explanation = model.predict(inputs)
-
-    explanation_rank_list = np.argsort(-explanation, axis=1)[:, :topk_keyphrase]
+    rating, explanation = predict_user(model, user_index, inputs)
 
-    unique_keyphrase = np.unique(explanation_rank_list)
+    unique_keyphrase = Keyphrase_Index(explanation[None], topk_keyphrase).choices(0)
     keyphrase_index = int(np.random.choice(unique_keyphrase, 1)[0])
 
     explanation[:, keyphrase_index] = np.min(explanation, axis=1)
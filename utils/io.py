@@ -1,6 +1,13 @@
+from utils.reformat import to_keyphrase_matrix
+
 import ast
+import itertools
+import json
+import numpy as np
 import os
 import pandas as pd
+import scipy.sparse as sparse
+import shutil
 import stat
 import yaml
 
@@ -21,6 +28,135 @@ def load_yaml(path, key='parameters'):
             print(exc)
 
 
+def split_cache_path(data_dir, name):
+    return data_dir + 'cache/' + os.path.splitext(name)[0] + '/'
+
+
+def source_signature(source):
+    """
+    :return: Modification time and size of a split CSV, used to detect a cache built from an older file.
+    """
+    if not os.path.isfile(source):
+        return None
+    source_stat = os.stat(source)
+    return [source_stat.st_mtime_ns, source_stat.st_size]
+
+
+def matches_source(signature, source):
+    """
+    :return: Whether a signature recorded in a cache matches the current source file. A missing source, e.g. a
+    cache shipped without its CSV, is trusted.
+    """
+    current = source_signature(source)
+    return current is None or signature == current
+
+
+def save_split_cache(df, path, user_col, item_col, rating_col, keyphrase_vector_col, source=None):
+    """
+    Write a split as .npy arrays that load_split memory-maps: int32 users and items, ratings and
+    the keyphrase lists as CSR indptr/indices.
+    :param source: CSV the split was read from, the cache is ignored once that file changes.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    # A shared store built from the previous contents of this split is stale
+    if os.path.isdir(path + 'shared/'):
+        shutil.rmtree(path + 'shared/')
+
+    keyphrase_vectors = df[keyphrase_vector_col].values
+    lengths = np.fromiter((len(vector) for vector in keyphrase_vectors), dtype=np.int64, count=len(keyphrase_vectors))
+    indices = np.fromiter(itertools.chain.from_iterable(keyphrase_vectors), dtype=np.int32, count=lengths.sum())
+
+    np.save(path + 'user.npy', df[user_col].values.astype(np.int32))
+    np.save(path + 'item.npy', df[item_col].values.astype(np.int32))
+    np.save(path + 'rating.npy', df[rating_col].values)
+    np.save(path + 'keyphrase_indptr.npy', np.concatenate([[0], np.cumsum(lengths)]))
+    np.save(path + 'keyphrase_indices.npy', indices)
+
+    with open(path + 'meta.json', 'w') as meta_file:
+        json.dump({'num_rows': len(df), 'user_col': user_col, 'item_col': item_col, 'rating_col': rating_col,
+                   'keyphrase_vector_col': keyphrase_vector_col,
+                   'source': source_signature(source) if source is not None else None}, meta_file)
+
+
+def split_cache_is_fresh(data_dir, name):
+    """
+    :return: Whether a cache of the split exists and was built from the current CSV.
+    """
+    # The directory alone may only hold a shared store, see utils.store
+    meta_path = split_cache_path(data_dir, name) + 'meta.json'
+    if not os.path.isfile(meta_path):
+        return False
+    with open(meta_path, 'r') as meta_file:
+        meta = json.load(meta_file)
+    return matches_source(meta.get('source'), data_dir + name)
+
+
+def load_split_arrays(data_dir, name):
+    """
+    :return: Memory-mapped users, items, ratings, keyphrase indptr and keyphrase indices of a cached split.
+    """
+    path = split_cache_path(data_dir, name)
+    return [np.load(path + array + '.npy', mmap_mode='r')
+            for array in ['user', 'item', 'rating', 'keyphrase_indptr', 'keyphrase_indices']]
+
+
+def load_split(data_dir, name, user_col, item_col, rating_col, keyphrase_vector_col):
+    """
+    Load a split with its keyphrase vectors parsed, from the binary cache written by dataset_cache.py
+    when present and built from the current CSV, and from the CSV otherwise.
+    :param name: Split file name, e.g. Train.csv.
+    """
+    if not split_cache_is_fresh(data_dir, name):
+        df = pd.read_csv(data_dir + name)
+        df[keyphrase_vector_col] = df[keyphrase_vector_col].apply(ast.literal_eval)
+        return df
+
+    users, items, ratings, indptr, indices = load_split_arrays(data_dir, name)
+    df = pd.DataFrame({user_col: users, item_col: items, rating_col: ratings})
+    df[keyphrase_vector_col] = np.split(np.asarray(indices), np.asarray(indptr[1:-1]))
+    return df
+
+
+def load_split_matrix(data_dir, name, user_col, item_col, rating_col, keyphrase_vector_col, num_keyphrases):
+    """
+    Load a split like load_split, but with its keyphrases as a count matrix for Negative_Sampler(keyphrase_matrix=...)
+    instead of a column of lists. From the cache the matrix wraps the memory-mapped CSR arrays, skipping the lists.
+    :return: DataFrame of users, items and ratings, and the keyphrase matrix of its rows.
+    """
+    if not split_cache_is_fresh(data_dir, name):
+        df = load_split(data_dir, name, user_col, item_col, rating_col, keyphrase_vector_col)
+        return (df.drop(columns=keyphrase_vector_col),
+                to_keyphrase_matrix(df[keyphrase_vector_col].values, num_keyphrases))
+
+    users, items, ratings, indptr, indices = load_split_arrays(data_dir, name)
+    df = pd.DataFrame({user_col: users, item_col: items, rating_col: ratings})
+    keyphrases = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(df), num_keyphrases))
+    if not keyphrases.has_canonical_format:
+        # Unsorted or repeated keyphrases in a review, counted as in to_keyphrase_matrix. The cache is read-only
+        keyphrases = keyphrases.copy()
+        keyphrases.sum_duplicates()
+    return df, keyphrases
+
+
+def load_dataset_counts(data_dir, user_col, item_col):
+    """
+    :return: Number of users and items, from the binary cache metadata when present and built from the current
+    user and item index files.
+    """
+    if os.path.isfile(data_dir + 'cache/meta.json'):
+        with open(data_dir + 'cache/meta.json', 'r') as meta_file:
+            meta = json.load(meta_file)
+        sources = meta.get('sources', [None, None])
+        if (matches_source(sources[0], data_dir + user_col + '.csv')
+                and matches_source(sources[1], data_dir + item_col + '.csv')):
+            return meta['num_users'], meta['num_items']
+
+    num_users = pd.read_csv(data_dir + user_col + '.csv')[user_col].nunique()
+    num_items = pd.read_csv(data_dir + item_col + '.csv')[item_col].nunique()
+    return num_users, num_items
+
+
 def find_best_hyperparameters(folder_path, metric):
     csv_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
                  if os.path.isfile(os.path.join(folder_path, f)) and f.endswith('.csv')]
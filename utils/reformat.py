@@ -1,5 +1,6 @@
 from sklearn.utils.extmath import randomized_svd
 
+import itertools
 import numpy as np
 import scipy.sparse as sparse
 
@@ -14,6 +15,34 @@ def to_sparse_matrix(df, num_user, num_item, user_col, item_col, rating_col):
     return sparse.csr_matrix((dok[:, 2].astype(np.float32), (dok[:, 0], dok[:, 1])), shape=shape)
 
 
+def to_keyphrase_matrix(keyphrase_vectors, num_keyphrases, row_index=None, num_rows=None):
+    """
+    Build a keyphrase count matrix from keyphrase index lists in linear time.
+    :param keyphrase_vectors: Sequence of keyphrase index lists, one per review.
+    :param num_keyphrases: Number of columns (keyphrase vocabulary size).
+    :param row_index: Output row of each list (e.g. its item), defaults to its position.
+    :param num_rows: Number of output rows, defaults to the number of lists.
+    :return: CSR matrix where duplicate (row, keyphrase) pairs are summed.
+    """
+    lengths = np.fromiter((len(vector) for vector in keyphrase_vectors), dtype=np.int64, count=len(keyphrase_vectors))
+    if row_index is None:
+        row_index = np.arange(len(lengths))
+    if num_rows is None:
+        num_rows = len(lengths)
+
+    row = np.repeat(row_index, lengths)
+    col = np.fromiter(itertools.chain.from_iterable(keyphrase_vectors), dtype=np.int64, count=lengths.sum())
+
+    return sparse.csr_matrix((np.ones(len(row)), (row, col)), shape=(num_rows, num_keyphrases))
+
+
+def to_sparse_feed(matrix):
+    coo = matrix.tocoo()
+    indices = np.vstack([coo.row, coo.col]).T.astype(np.int64)
+
+    return indices, coo.data.astype(np.int32), np.array(coo.shape, dtype=np.int64)
+
+
 def to_laplacian(R, rank):
     W = R.dot(R.T)
     D = np.squeeze(np.asarray(W.sum(axis=1)))
@@ -1,11 +1,18 @@
+from utils.reformat import to_keyphrase_matrix
+
 import numpy as np
-import pandas as pd
-import random
+import queue
 import scipy.sparse as sparse
+import threading
 
 
 class Negative_Sampler(object):
-    def __init__(self, df, user_col, item_col, rating_col, keyphrase_vector_col, num_items, batch_size, num_keyphrases, negative_sampling_size=10):
+    """
+    :param keyphrase_matrix: Precomputed keyphrase matrix of the rows of df, e.g. from a Shared_Store.
+    :param positive_matrix: Precomputed sorted user x item CSR matrix of the rows of df.
+    """
+    def __init__(self, df, user_col, item_col, rating_col, keyphrase_vector_col, num_items, batch_size, num_keyphrases, negative_sampling_size=10,
+                 keyphrase_matrix=None, positive_matrix=None):
         self.df = df
         self.user_col = user_col
         self.item_col = item_col
@@ -15,6 +22,8 @@ class Negative_Sampler(object):
         self.batch_size = batch_size
         self.num_keyphrases = num_keyphrases
         self.negative_sampling_size = negative_sampling_size
+        self.keyphrase_matrix = keyphrase_matrix
+        self.positive_matrix = positive_matrix
         self.prepare_positive_sampling()
         self.prepare_negative_sampling()
 
@@ -22,22 +31,15 @@ class Negative_Sampler(object):
         self.users = np.concatenate([self.pos_users, self.neg_users])
         self.items = np.concatenate([self.pos_items, self.neg_items])
         self.ratings = np.concatenate([self.pos_ratings, self.neg_ratings])
-        self.keyphrases_vector = sparse.vstack([self.pos_keyphrases, self.neg_keyphrases])
         if permutation:
-            index = np.random.permutation(len(self.users))
-            self.users = self.users[index]
-            self.items = self.items[index]
-            self.ratings = self.ratings[index]
-            self.keyphrases_vector = self.keyphrases_vector[index]
+            self.index = np.random.permutation(len(self.users))
+        else:
+            self.index = np.arange(len(self.users))
 
     def sparsify_keyphrases_vector(self):
-        df_keyphrases_vector = self.df[[self.keyphrase_vector_col]].assign(row_index=np.arange(len(self.df)))
-        series_key = df_keyphrases_vector.set_index(['row_index'])[self.keyphrase_vector_col].apply(pd.Series).stack().reset_index(level=1, drop=True)
-
-        row = series_key.index.values
-        col = series_key.values.astype(int)
-
-        return sparse.csr_matrix((np.ones(len(row)), (row, col)), shape=(len(self.df), self.num_keyphrases))
+        if self.keyphrase_matrix is not None:
+            return self.keyphrase_matrix
+        return to_keyphrase_matrix(self.df[self.keyphrase_vector_col].values, self.num_keyphrases)
 
     def prepare_positive_sampling(self):
         self.pos_users = self.df[self.user_col].values
@@ -46,42 +48,141 @@ class Negative_Sampler(object):
         self.pos_keyphrases = self.sparsify_keyphrases_vector()
 
     def prepare_negative_sampling(self):
-        self.df_user = self.df[[self.user_col, self.item_col]].groupby(self.user_col)[self.item_col].apply(list).to_frame().reset_index()
-        self.df_user['Num_Pos'] = self.df_user[self.item_col].str.len()
-        self.df_user['Unobserved'] = self.df_user[self.item_col].apply(lambda observed_items: np.setdiff1d(np.arange(self.num_items), observed_items))
-        self.df_user['Num_Unobserved'] = self.df_user['Unobserved'].str.len()
-        self.df_user['Num_Neg'] = self.df_user['Num_Pos'] * self.negative_sampling_size
-        self.df_user.loc[self.df_user.Num_Neg > self.df_user.Num_Unobserved, 'Num_Neg'] = self.df_user.Num_Unobserved
+        num_users = self.pos_users.max() + 1
+        if self.positive_matrix is None:
+            self.positive_matrix = sparse.csr_matrix((np.ones(len(self.pos_users)), (self.pos_users, self.pos_items)),
+                                                     shape=(num_users, self.num_items))
+            self.positive_matrix.sort_indices()
+        num_pos = np.bincount(self.pos_users, minlength=num_users)
+        num_unobserved = self.num_items - np.diff(self.positive_matrix.indptr)
+        self.num_negatives = np.minimum(num_pos * self.negative_sampling_size, num_unobserved)
 
-    def sample_negative(self):
-        self.df_user['Sampled_Items'] = self.df_user.apply(lambda row: np.random.choice(row['Unobserved'], row['Num_Neg'], replace=False), axis=1)
-        series_user = self.df_user.set_index([self.user_col])['Sampled_Items'].apply(pd.Series).stack().reset_index(level=1, drop=True)
+        # Negative rows carry no keyphrases, so the stacked matrix is the same for every epoch.
+        # Only indptr grows; data and indices stay shared with the positive keyphrase matrix.
+        num_rows = len(self.pos_users) + self.num_negatives.sum()
+        indptr = np.concatenate([self.pos_keyphrases.indptr,
+                                 np.full(self.num_negatives.sum(), self.pos_keyphrases.indptr[-1],
+                                         dtype=self.pos_keyphrases.indptr.dtype)])
+        self.keyphrases_vector = sparse.csr_matrix((self.pos_keyphrases.data, self.pos_keyphrases.indices, indptr),
+                                                   shape=(num_rows, self.num_keyphrases), copy=False)
 
-        self.neg_users = series_user.index.values
-        self.neg_items = series_user.values.astype(int)
+    def sample_negative(self):
+        self.neg_users, self.neg_items = sample_negative_items(self.positive_matrix, self.num_negatives)
         self.neg_ratings = np.zeros(len(self.neg_users))
-        self.neg_keyphrases = sparse.csr_matrix((len(self.neg_users), self.num_keyphrases))
 
-    def get_batches(self):
+        return self.neg_users, self.neg_items
+
+    def sample_epoch(self):
         self.sample_negative()
         self.concate_data()
 
-        remaining_size = len(self.users)
-
-        batch_index = 0
-        batches = []
-        while remaining_size > 0:
-            if remaining_size < self.batch_size:
-                batches.append([self.users[batch_index*self.batch_size:],
-                                self.items[batch_index*self.batch_size:],
-                                self.ratings[batch_index*self.batch_size:],
-                                self.keyphrases_vector[batch_index*self.batch_size:]])
-            else:
-                batches.append([self.users[batch_index*self.batch_size:(batch_index+1)*self.batch_size],
-                                self.items[batch_index*self.batch_size:(batch_index+1)*self.batch_size],
-                                self.ratings[batch_index*self.batch_size:(batch_index+1)*self.batch_size],
-                                self.keyphrases_vector[batch_index*self.batch_size:(batch_index+1)*self.batch_size]])
-            batch_index += 1
-            remaining_size -= self.batch_size
-        random.shuffle(batches)
-        return batches
+        return self.users, self.items, self.ratings, self.index
+
+    def iterate_batches(self, epoch=None):
+        """
+        Lazily yield the mini-batches of an epoch, sampling a fresh one unless it is given.
+        Keyphrase rows are sliced from the shared CSR matrix only when a batch is requested.
+        """
+        if epoch is None:
+            epoch = self.sample_epoch()
+
+        users, items, ratings, index = epoch
+        for start in range(0, len(index), self.batch_size):
+            batch_index = index[start:start+self.batch_size]
+            yield [users[batch_index],
+                   items[batch_index],
+                   ratings[batch_index],
+                   self.keyphrases_vector[batch_index]]
+
+    def get_batches(self):
+        return list(self.iterate_batches())
+
+
+
+class Prefetch_Sampler(object):
+    """
+    Wrap a Negative_Sampler so the next epochs are sampled in a worker thread while the current one trains.
+    """
+    def __init__(self, negative_sampler, num_prefetch=1):
+        self.negative_sampler = negative_sampler
+        self.queue = queue.Queue(maxsize=num_prefetch)
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.prefetch)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def __getattr__(self, name):
+        return getattr(self.negative_sampler, name)
+
+    def prefetch(self):
+        while not self.stopped.is_set():
+            try:
+                epoch = self.negative_sampler.sample_epoch()
+            except Exception as e:
+                epoch = e
+            while not self.stopped.is_set():
+                try:
+                    self.queue.put(epoch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def sample_epoch(self):
+        epoch = self.queue.get()
+        if isinstance(epoch, Exception):
+            raise epoch
+        return epoch
+
+    def iterate_batches(self):
+        return self.negative_sampler.iterate_batches(self.sample_epoch())
+
+    def get_batches(self):
+        return list(self.iterate_batches())
+
+    def close(self):
+        self.stopped.set()
+        self.worker.join()
+
+
+def sample_negative_items(positives, num_negatives, max_rounds=10):
+    """
+    Draw num_negatives[u] distinct unobserved items for every user u in one vectorized pass.
+    :param positives: Sorted CSR matrix (users x items) of observed interactions.
+    :param num_negatives: Number of negative items to draw per user.
+    :param max_rounds: Rejection sampling rounds before falling back to exact sampling.
+    :return: Users and items of the sampled negative pairs, sorted by user.
+    """
+    num_users, num_items = positives.shape
+    user_range = np.arange(num_users, dtype=np.int64)
+    positive_keys = np.repeat(user_range, np.diff(positives.indptr)) * num_items + positives.indices
+    num_negatives = np.asarray(num_negatives, dtype=np.int64)
+
+    sampled_keys = np.array([], dtype=np.int64)
+    remaining = num_negatives
+    for _ in range(max_rounds):
+        if not remaining.any():
+            break
+        keys = np.repeat(user_range, remaining) * num_items + np.random.randint(num_items, size=remaining.sum())
+
+        # Reject candidates that hit an observed item, then drop repeated draws
+        if len(positive_keys) > 0:
+            position = np.minimum(np.searchsorted(positive_keys, keys), len(positive_keys) - 1)
+            keys = keys[positive_keys[position] != keys]
+        sampled_keys = np.sort(np.concatenate([sampled_keys, keys]))
+        first = np.ones(len(sampled_keys), dtype=bool)
+        first[1:] = sampled_keys[1:] != sampled_keys[:-1]
+        sampled_keys = sampled_keys[first]
+        remaining = num_negatives - np.bincount(sampled_keys // num_items, minlength=num_users)
+
+    # Users whose unobserved set is nearly exhausted are completed exactly
+    if remaining.any():
+        extra_keys = []
+        for user in np.flatnonzero(remaining):
+            observed = positives.indices[positives.indptr[user]:positives.indptr[user+1]]
+            taken = sampled_keys[np.searchsorted(sampled_keys, user * num_items):
+                                 np.searchsorted(sampled_keys, (user + 1) * num_items)] % num_items
+            candidates = np.setdiff1d(np.arange(num_items), np.concatenate([observed, taken]))
+            extra_keys.append(user * num_items + np.random.choice(candidates, remaining[user], replace=False))
+        sampled_keys = np.sort(np.concatenate([sampled_keys] + extra_keys))
+
+    return sampled_keys // num_items, sampled_keys % num_items
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from utils.critique import predict_user
+
+import numpy as np
+import threading
+import time
+
+
+class Refine_Critique(object):
+    """
+    Multi-step critiquing of one user through the model's refine_predict, for models without a closed-form update.
+    """
+    def __init__(self, model, user_index, num_items):
+        self.model = model
+        self.inputs = np.stack([np.full(num_items, user_index), np.arange(num_items)], axis=1)
+        rating, self.explanation = predict_user(model, user_index, self.inputs)
+        self.rating = rating.ravel()
+        self.row_min = np.min(self.explanation, axis=1)
+        self.critiqued = self.explanation.copy()
+        self.modified_rating = self.rating
+        self.modified_keyphrases = self.explanation
+        self.critiqued_keyphrases = []
+
+    def critique(self, keyphrase_index):
+        self.critiqued[:, keyphrase_index] = self.row_min
+        self.critiqued_keyphrases.append(keyphrase_index)
+
+        modified_rating, self.modified_keyphrases = self.model.refine_predict(self.inputs, self.critiqued)
+        self.modified_rating = modified_rating.ravel()
+        return self.modified_rating
+
+    def modified_explanation(self):
+        return self.modified_keyphrases
+
+    def density_shifting_estimate(self):
+        return self.model.density_shifting_estimate(self.inputs, self.critiqued)
+
+
+class Session_Store(object):
+    """
+    Critiquing sessions of active users, evicted least recently used first beyond max_sessions
+    and after ttl seconds without access.
+    """
+    def __init__(self, model, num_items, max_sessions=1000, ttl=1800, clock=time.monotonic):
+        self.model = model
+        self.num_items = num_items
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.clock = clock
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, user_index):
+        return user_index in self.sessions
+
+    def create_session(self, user_index):
+        # CE-NCF and CE-VNCF critique in closed form, other models go through refine_predict
+        if getattr(self.model, 'closed_form_critique', False):
+            return self.model.critique(user_index)
+        return Refine_Critique(self.model, user_index, self.num_items)
+
+    def evict_expired(self, now=None):
+        if now is None:
+            now = self.clock()
+        while self.sessions:
+            user_index, (_, last_access) = next(iter(self.sessions.items()))
+            if now - last_access < self.ttl:
+                break
+            del self.sessions[user_index]
+
+    def get(self, user_index):
+        now = self.clock()
+        with self.lock:
+            self.evict_expired(now)
+            if user_index in self.sessions:
+                session, _ = self.sessions.pop(user_index)
+                self.sessions[user_index] = (session, now)
+                return session
+
+        session = self.create_session(user_index)
+        with self.lock:
+            self.sessions[user_index] = (session, now)
+            self.sessions.move_to_end(user_index)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return session
+
+    def critique(self, user_index, keyphrase_index):
+        return self.get(user_index).critique(keyphrase_index)
+
+    def recommend(self, user_index, topk):
+        rating = self.get(user_index).modified_rating
+        topk = min(topk, len(rating))
+        candidates = np.argpartition(-rating, topk - 1)[:topk]
+        return candidates[np.argsort(-rating[candidates])]
+
+    def close(self, user_index):
+        with self.lock:
+            self.sessions.pop(user_index, None)
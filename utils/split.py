@@ -1,6 +1,43 @@
+import numpy as np
+
+
+def per_user_ranks(users, random_state=None):
+    """
+    :param users: User of each row.
+    :return: A uniformly random rank of each row among the rows of its user, and the number of rows of its user.
+    """
+    random_keys = np.random.RandomState(random_state).random_sample(len(users))
+    order = np.lexsort((random_keys, users))
+    sorted_users = users[order]
+
+    group_starts = np.flatnonzero(np.concatenate([[True], sorted_users[1:] != sorted_users[:-1]]))
+    group_sizes = np.diff(np.append(group_starts, len(users)))
+
+    ranks = np.empty(len(users), dtype=np.int64)
+    ranks[order] = np.arange(len(users)) - np.repeat(group_starts, group_sizes)
+    counts = np.empty(len(users), dtype=np.int64)
+    counts[order] = np.repeat(group_sizes, group_sizes)
+
+    return ranks, counts
+
+
 def leave_one_out_split(df, user_col, ratio, random_state=None):
-    grouped = df.groupby(user_col, as_index=False)
-    valid = grouped.apply(lambda x: x.sample(frac=ratio, random_state=random_state))
-    train = df.loc[~df.index.isin([x[1] for x in valid.index])]
-    return train, valid
+    ranks, counts = per_user_ranks(df[user_col].values, random_state)
+    holdout = ranks < np.round(ratio*counts)
+    return df[~holdout], df[holdout]
+
+
+def holdout_split(df, user_col, ratio, random_state=None, validation=True):
+    """
+    Hold out round(ratio*n) of each user's n rows for test and, if enabled, round(ratio*(n - test)) of the rest
+    for validation, from one random rank per row.
+    :return: Train, validation (None when disabled) and test frames.
+    """
+    ranks, counts = per_user_ranks(df[user_col].values, random_state)
+    num_test = np.round(ratio*counts)
+    test = ranks < num_test
+    if not validation:
+        return df[~test], None, df[test]
 
+    valid = ~test & (ranks < num_test + np.round(ratio*(counts - num_test)))
+    return df[~test & ~valid], df[valid], df[test]
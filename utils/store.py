@@ -0,0 +1,119 @@
+from utils.io import source_signature
+from utils.reformat import to_keyphrase_matrix
+
+import json
+import numpy as np
+import os
+import pandas as pd
+import scipy.sparse as sparse
+import shutil
+import tempfile
+
+
+def shared_store_is_fresh(path, source=None):
+    """
+    :return: Whether a complete store exists at path and was built from the current source CSV.
+    """
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.isfile(meta_path):
+        return False
+    if source is None:
+        return True
+    with open(meta_path, 'r') as meta_file:
+        meta = json.load(meta_file)
+    signature = source_signature(source)
+    return signature is None or meta.get('source') == signature
+
+
+def build_shared_store(path, df, user_col, item_col, keyphrase_vector_col, num_items, num_keyphrases, source=None,
+                       keyphrase_matrix=None):
+    """
+    Write the positive interactions of df, their keyphrase matrix and the user x item positive matrix as .npy
+    files for Shared_Store. The store is written to a temporary directory and renamed into place, so concurrent
+    jobs building the same store never attach to a partial one. A fresh existing store is left untouched, one
+    built from an older source is replaced.
+    :param source: CSV df was read from, e.g. Train.csv.
+    :param keyphrase_matrix: Keyphrase matrix of the rows of df, built from its keyphrase lists if not given.
+    """
+    if shared_store_is_fresh(path, source):
+        return
+
+    users = df[user_col].values.astype(np.int32)
+    items = df[item_col].values.astype(np.int32)
+    keyphrases = keyphrase_matrix
+    if keyphrases is None:
+        keyphrases = to_keyphrase_matrix(df[keyphrase_vector_col].values, num_keyphrases)
+    positive_matrix = sparse.csr_matrix((np.ones(len(users)), (users, items)), shape=(users.max() + 1, num_items))
+    positive_matrix.sort_indices()
+
+    parent = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    temp_path = tempfile.mkdtemp(dir=parent)
+
+    arrays = {'user': users, 'item': items}
+    for name, matrix in [('keyphrase', keyphrases), ('positive', positive_matrix)]:
+        arrays.update({name + '_data': matrix.data, name + '_indices': matrix.indices, name + '_indptr': matrix.indptr})
+    for name, array in arrays.items():
+        np.save(os.path.join(temp_path, name + '.npy'), array)
+
+    with open(os.path.join(temp_path, 'meta.json'), 'w') as meta_file:
+        json.dump({'user_col': user_col, 'item_col': item_col, 'num_users': int(positive_matrix.shape[0]),
+                   'num_items': num_items, 'num_keyphrases': num_keyphrases,
+                   'source': source_signature(source) if source is not None else None}, meta_file)
+
+    stale_path = None
+    if os.path.isdir(path):
+        # Jobs attached to the stale store keep their memory maps after its files are removed
+        stale_path = tempfile.mkdtemp(dir=parent)
+        try:
+            os.rename(path, stale_path)
+        except OSError:
+            # Another job moved it first
+            pass
+
+    try:
+        os.rename(temp_path, path)
+    except OSError:
+        # Another job finished the same store first
+        shutil.rmtree(temp_path)
+
+    if stale_path is not None:
+        shutil.rmtree(stale_path)
+
+
+class Shared_Store(object):
+    """
+    Read-only view of a store written by build_shared_store. Arrays are memory-mapped, so every process
+    attached to the same store shares one copy of the data through the page cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+
+        self.users = self.load('user')
+        self.items = self.load('item')
+        self.keyphrases = self.load_csr('keyphrase', (len(self.users), self.meta['num_keyphrases']))
+        self.positive_matrix = self.load_csr('positive', (self.meta['num_users'], self.meta['num_items']))
+
+    def load(self, name):
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def load_csr(self, name, shape):
+        return sparse.csr_matrix((self.load(name + '_data'), self.load(name + '_indices'), self.load(name + '_indptr')),
+                                 shape=shape, copy=False)
+
+    def frame(self, rating_col):
+        """
+        :return: Positive interactions as a DataFrame backed by the memory-mapped arrays, without keyphrases.
+        """
+        return pd.DataFrame({self.meta['user_col']: self.users,
+                             self.meta['item_col']: self.items,
+                             rating_col: np.ones(len(self.users), dtype=np.int8)}, copy=False)
+
+    def sampler_structures(self):
+        """
+        :return: Keyword arguments that let Negative_Sampler reuse the shared matrices.
+        """
+        return {'keyphrase_matrix': self.keyphrases, 'positive_matrix': self.positive_matrix}